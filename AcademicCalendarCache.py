@@ -0,0 +1,119 @@
+import datetime
+import hashlib
+import json
+import os
+import time
+
+"""
+On-disk cache of the academic calendar pages and of the closure dates parsed from them.
+
+A page younger than the TTL is not downloaded again. An older one is revalidated with
+If-None-Match / If-Modified-Since, and a 304 reuses the dates already parsed. When the site
+cannot be reached, the last known dates are used.
+"""
+
+DEFAULT_TTL = 24 * 60 * 60
+TIMEOUT = 10
+
+_session = None
+
+
+def get_session():
+    """
+    :return: requests.Session shared by every download, keeps the connection to the site alive
+    """
+    global _session
+    if _session is None:
+        import requests
+        _session = requests.Session()
+    return _session
+
+
+class AcademicCalendarCache:
+    """
+    One JSON file per page with its validators, the time it was fetched and its parsed dates,
+    next to the html of the page.
+    """
+
+    def __init__(self, directory='.academic_calendar_cache', ttl=DEFAULT_TTL, offline=False):
+        """
+        :param directory: Directory of the cache
+        :param ttl: Seconds a page is used without asking the site if it changed
+        :param offline: Never download, only use the cache
+        """
+        self.directory = directory
+        self.ttl = ttl
+        self.offline = offline
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, url):
+        name = hashlib.sha1(url.encode()).hexdigest()
+        return os.path.join(self.directory, f"{name}.json"), os.path.join(self.directory, f"{name}.html")
+
+    def load(self, url):
+        """
+        :return: Cache entry of the url, None if there is none
+        """
+        meta_path, _ = self._paths(url)
+        try:
+            with open(meta_path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def store(self, url, entry, html=None):
+        meta_path, html_path = self._paths(url)
+        if html is not None:
+            with open(html_path, 'wb') as f:
+                f.write(html)
+        tmp_path = f"{meta_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, meta_path)
+
+    def get_dates(self, url, parse):
+        """
+        :param url: Page of the academic calendar
+        :param parse: Function turning the html of the page into a list of datetime.datetime
+        :return: List of datetime.datetime
+        """
+        entry = self.load(url)
+        if entry is not None and (self.offline or time.time() - entry['fetched_at'] < self.ttl):
+            return _dates(entry)
+        if self.offline:
+            raise FileNotFoundError(f"No cached copy of {url} in offline mode")
+        import requests
+
+        headers = {}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        try:
+            response = get_session().get(url, headers=headers, timeout=TIMEOUT)
+            response.raise_for_status()
+        except requests.RequestException as err:
+            if entry is None:
+                raise
+            print(f"Failed to download {url}, using the cached dates. Error: {err}")
+            return _dates(entry)
+
+        if response.status_code == 304 and entry is not None:
+            entry['fetched_at'] = time.time()
+            self.store(url, entry)
+            return _dates(entry)
+
+        dates = parse(response.content)
+        self.store(url, {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'fetched_at': time.time(),
+            'dates': [date.isoformat() for date in dates],
+        }, response.content)
+        return dates
+
+
+def _dates(entry):
+    return [datetime.datetime.fromisoformat(date) for date in entry['dates']]
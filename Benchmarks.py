@@ -0,0 +1,463 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, time as dtime, timedelta
+
+import BulkParser
+import CalendarExecutor
+import CalendarSync
+import CohortStore
+import ConflictDetector
+import CourseScheduleParser
+import EventBuilder
+import GcalApiIntegration
+import LoadTest
+import Occurrences
+import SyntheticCart
+from FakeCalendarService import FakeCalendarService
+
+"""
+Benchmarks run against local fakes, no Google account or network needed.
+Run with: python Benchmarks.py [names...] [--json results.json]
+The JSON output holds the results of every benchmark with the Python version and platform,
+so runs of different releases can be compared.
+"""
+
+
+def sample_courses(n_courses, blocks_per_course=3):
+    """
+    Builds n_courses courses with blocks_per_course time blocks each.
+    """
+    courses = {}
+    components = ['Lec', 'Tut', 'Lab']
+    for i in range(n_courses):
+        events = [
+            CourseScheduleParser.TimeBlock(
+                start_date=date(2023, 9, 5),
+                end_date=date(2023, 12, 4),
+                start_time=dtime(8 + j, 45),
+                end_time=dtime(10 + j, 0),
+                days=['MO', 'WE'],
+                address="1455 de Maisonneuve Boulevard West",
+                room=f"H{500 + j}",
+                instructor="JOUMANA DARGHAM",
+                class_number=str(1000 + i * blocks_per_course + j),
+                section=f"S{j}",
+                component=components[j % len(components)],
+            )
+            for j in range(blocks_per_course)
+        ]
+        title = f"COMP {200 + i}"
+        courses[title] = CourseScheduleParser.Course(title, "SAMPLE COURSE", "3.00", events)
+    return courses
+
+
+def bench_populate_round_trips(n_courses=20):
+    """
+    Compares the number of HTTP round trips of populate_events and populate_events_batched.
+    """
+    courses = sample_courses(n_courses)
+    results = {}
+
+    service = FakeCalendarService()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        GcalApiIntegration.populate_events('bench', courses, None, service)
+    results['populate_events'] = (service.round_trips, time.perf_counter() - start)
+
+    service = FakeCalendarService()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        GcalApiIntegration.populate_events_batched('bench', courses, service)
+    results['populate_events_batched'] = (service.round_trips, time.perf_counter() - start)
+
+    for name, (round_trips, seconds) in results.items():
+        print(f"{name}: {round_trips} round trips, {seconds * 1000:.1f} ms")
+    return results
+
+
+def bench_token_bucket(rate=100, capacity=10, tokens=50, calls=4):
+    """
+    Times calls acquires of tokens each, ex: batches of 50 calls. Every call past the burst must be
+    paid for, so it takes at least (calls * tokens - capacity) / rate seconds.
+    """
+    bucket = CalendarExecutor.TokenBucket(rate, capacity)
+    start = time.perf_counter()
+    for _ in range(calls):
+        bucket.acquire(tokens)
+    seconds = time.perf_counter() - start
+    expected = (calls * tokens - capacity) / rate
+    print(f"token bucket: {calls} x {tokens} tokens at {rate}/s in {seconds:.2f} s, expected {expected:.2f} s")
+    assert seconds >= expected * 0.95, "the token bucket let batches through under their cost"
+    return {'seconds': seconds, 'expected': expected}
+
+
+def bench_executor_under_quota(n_courses=20, latency=0.02, error_rate=0.1):
+    """
+    Pushes the sample courses through the RequestExecutor against a fake service that
+    adds latency and fails a share of the calls with quota errors.
+    """
+    courses = sample_courses(n_courses)
+    service = FakeCalendarService(latency=latency, error_rate=error_rate)
+    executor = CalendarExecutor.RequestExecutor(rate=50, burst=50, base_delay=0.05)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = GcalApiIntegration.populate_events_batched('bench', courses, service, batch_size=10,
+                                                             executor=executor)
+    seconds = time.perf_counter() - start
+    failed = sum(result['error'] is not None for result in results)
+    print(f"executor: {len(results) - failed}/{len(results)} created in {seconds * 1000:.1f} ms, "
+          f"{executor.metrics.summary()}")
+    return executor.metrics.summary()
+
+
+def measure(function, *args):
+    """
+    :return: (seconds, peak traced memory in bytes) of one call, with its output silenced.
+    The memory is measured on a second call since tracing slows everything down.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        function(*args)
+        seconds = time.perf_counter() - start
+        tracemalloc.start()
+        function(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return seconds, peak
+
+
+def bench_parse_engines(sizes=(10, 100, 1000)):
+    """
+    Compares the BeautifulSoup tree path with the streaming parser on synthetic carts.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for n_courses in sizes:
+            path = os.path.join(directory, f"cart_{n_courses}.html")
+            SyntheticCart.write_cart(path, n_courses)
+            soup = measure(CourseScheduleParser.extract_courses_soup, path)
+            stream = measure(CourseScheduleParser.extract_courses_stream, path)
+            results[n_courses] = {'soup': soup, 'stream': stream}
+            print(f"{n_courses} courses: soup {soup[0] * 1000:.1f} ms / {soup[1] / 2 ** 20:.1f} MiB, "
+                  f"stream {stream[0] * 1000:.1f} ms / {stream[1] / 2 ** 20:.1f} MiB, "
+                  f"{soup[0] / stream[0]:.1f}x faster")
+    return results
+
+
+def bench_bulk_parse(n_files=40, n_courses=50, workers=(1, 2, 4)):
+    """
+    Parses a directory of synthetic carts with BulkParser using different numbers of processes.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for i in range(n_files):
+            SyntheticCart.write_cart(os.path.join(directory, f"student{i}{BulkParser.CART_SUFFIX}"), n_courses, seed=i)
+        paths = BulkParser.find_carts(directory)
+        for n in workers:
+            start = time.perf_counter()
+            with open(os.devnull, 'w') as output:
+                BulkParser.write_jsonl(BulkParser.iter_parsed(paths, n), output)
+            seconds = time.perf_counter() - start
+            results[n] = n_files / seconds
+            print(f"bulk parse, {n} workers: {results[n]:.1f} carts/s")
+    return results
+
+
+def expand_loop(blocks, exclusions):
+    """
+    One meeting at a time, the reference for bench_occurrences.
+    """
+    meetings = []
+    for block in blocks:
+        weekdays = {CourseScheduleParser.DAY_MAPPING[day] for day in block.days}
+        day = block.start_date
+        while day <= block.end_date:
+            if day.weekday() in weekdays and day not in exclusions:
+                meetings.append((datetime.combine(day, block.start_time), datetime.combine(day, block.end_time)))
+            day += timedelta(days=1)
+    return meetings
+
+
+def bench_occurrences(n_courses=1000):
+    """
+    Expands the time blocks of n_courses sample courses into their meetings, with NumPy
+    and with a loop over the days of the term.
+    """
+    blocks = [event for course in sample_courses(n_courses).values() for event in course.events]
+    exclusions = {date(2023, 10, 9), date(2023, 11, 1)}
+
+    start = time.perf_counter()
+    occurrences = Occurrences.expand(blocks, exclusions)
+    vectorized = time.perf_counter() - start
+    start = time.perf_counter()
+    meetings = expand_loop(blocks, exclusions)
+    loop = time.perf_counter() - start
+
+    assert len(occurrences) == len(meetings)
+    print(f"occurrences of {len(blocks)} blocks: {len(meetings)} meetings, numpy {vectorized * 1000:.1f} ms, "
+          f"loop {loop * 1000:.1f} ms, {loop / vectorized:.1f}x faster")
+    return {'blocks': len(blocks), 'meetings': len(meetings), 'numpy': vectorized, 'loop': loop}
+
+
+def bench_conflicts(n_students=2000, n_courses=6):
+    """
+    Checks the schedules of n_students random synthetic carts for conflicts.
+    """
+    schedules = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'cart.html')
+        for i in range(50):
+            SyntheticCart.write_cart(path, n_courses, seed=i)
+            schedules.append(CourseScheduleParser.shift_start_date(CourseScheduleParser.extract_courses_stream(path)))
+    results = [(None, f"student{i}", schedules[i % len(schedules)], None) for i in range(n_students)]
+
+    start = time.perf_counter()
+    reports = list(ConflictDetector.check_bulk(results))
+    seconds = time.perf_counter() - start
+    with_conflicts = sum(bool(report['conflicts']) for report in reports)
+    print(f"conflicts: {n_students} students in {seconds * 1000:.1f} ms, {with_conflicts} with conflicts")
+    return {'students': n_students, 'seconds': seconds, 'with_conflicts': with_conflicts}
+
+
+def bench_cohort_store(n_students=5000, n_courses=6):
+    """
+    Builds, saves and memory maps the CohortStore of n_students synthetic carts, and compares
+    "who is in this room on Wednesday at 18:30" with a loop over the Course objects.
+    """
+    schedules = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'cart.html')
+        for i in range(50):
+            SyntheticCart.write_cart(path, n_courses, seed=i)
+            schedules.append(CourseScheduleParser.shift_start_date(CourseScheduleParser.extract_courses_stream(path)))
+    students = [(f"student{i}", schedules[i % len(schedules)]) for i in range(n_students)]
+    room, day, when = 'H521', 'WE', dtime(18, 30)
+
+    def loop():
+        return sorted({student for student, courses in students for course in courses.values()
+                       for event in course.events
+                       if event.room == room and day in event.days and event.start_time <= when < event.end_time})
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        store = CohortStore.CohortStore.build(students)
+        results['build'] = time.perf_counter() - start
+        start = time.perf_counter()
+        store.save(directory)
+        results['save'] = time.perf_counter() - start
+        start = time.perf_counter()
+        store = CohortStore.CohortStore.open(directory)
+        results['open'] = time.perf_counter() - start
+        start = time.perf_counter()
+        found = store.students(store.query(room=room, day=day, when=when))
+        results['query'] = time.perf_counter() - start
+        start = time.perf_counter()
+        assert loop() == found
+        results['query_loop'] = time.perf_counter() - start
+        del store
+
+    for name, seconds in results.items():
+        print(f"cohort store {name}: {seconds * 1000:.2f} ms")
+    return results | {'students': n_students, 'found': len(found)}
+
+
+def bench_serializers(n_courses=1000):
+    """
+    Compares json.dumps(indent=4) with CourseScheduleParser.courses_to_bytes on a synthetic cart.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'cart.html')
+        SyntheticCart.write_cart(path, n_courses)
+        courses = CourseScheduleParser.extract_courses_stream(path)
+
+    results = {}
+    start = time.perf_counter()
+    text = json.dumps(courses, indent=4, cls=CourseScheduleParser.ClassEncoder)
+    results['json'] = (time.perf_counter() - start, len(text))
+    start = time.perf_counter()
+    data = CourseScheduleParser.courses_to_bytes(courses)
+    results['bytes'] = (time.perf_counter() - start, len(data))
+    start = time.perf_counter()
+    assert CourseScheduleParser.courses_from_bytes(data) == courses
+    results['bytes_load'] = (time.perf_counter() - start, len(data))
+
+    for name, (seconds, size) in results.items():
+        print(f"serialize {name}: {seconds * 1000:.1f} ms, {size / 1024:.0f} KiB")
+    return results
+
+
+
+def bench_parse_course_cart(sizes=(1, 10, 100, 1000, 10000)):
+    """
+    Runs parse_course_cart, the whole parsing path of Driver, on synthetic carts of every size.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for n_courses in sizes:
+            path = os.path.join(directory, f"cart_{n_courses}.html")
+            blocks = SyntheticCart.write_cart(path, n_courses)
+            seconds, peak = measure(CourseScheduleParser.parse_course_cart, path)
+            results[n_courses] = {'blocks': blocks, 'seconds': seconds, 'peak_bytes': peak}
+            print(f"parse_course_cart, {n_courses} courses: {seconds * 1000:.1f} ms, {peak / 2 ** 20:.1f} MiB")
+    return results
+
+
+def bench_cleaners(n=20000):
+    """
+    Times clean_cls_day_time and clean_cls_dates, called once per class of the cart.
+    """
+    schedules = ['MoWe 6:30PM - 8:10PM', 'TuTh 8:45AM - 10:00AM', 'Fr 1:15PM - 4:00PM']
+    dates = ['05/09/2023 - 04/12/2023', '08/01/2024 - 12/04/2024']
+    results = {}
+    start = time.perf_counter()
+    for i in range(n):
+        CourseScheduleParser.clean_cls_day_time(schedules[i % len(schedules)])
+    results['clean_cls_day_time'] = (time.perf_counter() - start) / n
+    start = time.perf_counter()
+    for i in range(n):
+        CourseScheduleParser.clean_cls_dates(dates[i % len(dates)])
+    results['clean_cls_dates'] = (time.perf_counter() - start) / n
+    for name, seconds in results.items():
+        print(f"{name}: {seconds * 1e6:.2f} us per call")
+    return results
+
+
+def bench_create_event(n_courses=2000):
+    """
+    Builds the event body of every block of n_courses sample courses, with and without closures.
+    """
+    import ParseAcademicCalendar
+    blocks = EventBuilder.keyed_blocks(sample_courses(n_courses))
+    closures = ParseAcademicCalendar.ClosureIndex([datetime(2023, 10, 9), datetime(2023, 11, 1)])
+    results = {}
+    for name, index in (('plain', None), ('closures', closures)):
+        start = time.perf_counter()
+        for _, course, event in blocks:
+            EventBuilder.create_event(course, event, index)
+        results[name] = (time.perf_counter() - start) / len(blocks)
+        print(f"create_event {name}: {results[name] * 1e6:.2f} us per event")
+    return results
+
+
+def bench_sync(n_courses=200, changed=10):
+    """
+    Publishes n_courses sample courses to a fake calendar, then syncs again after changing
+    the room of a few blocks. Only the changed blocks should be sent.
+    """
+    courses = sample_courses(n_courses)
+    service = FakeCalendarService()
+    results = {}
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        summary = CalendarSync.sync_events('bench', courses, service)
+    results['initial'] = {'seconds': time.perf_counter() - start, 'round_trips': service.round_trips,
+                          'inserted': summary['inserted']}
+
+    for title in list(courses)[:changed]:
+        course = courses[title]
+        courses[title] = course.replace(events=[course.events[0].replace(room='H999')] + list(course.events[1:]))
+    round_trips = service.round_trips
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        summary = CalendarSync.sync_events('bench', courses, service)
+    results['incremental'] = {'seconds': time.perf_counter() - start,
+                              'round_trips': service.round_trips - round_trips, 'patched': summary['patched']}
+    for name, result in results.items():
+        print(f"sync {name}: {result}")
+    return results
+
+
+def bench_import_time(modules=('Driver', 'CourseScheduleParser', 'IcsExport', 'BulkParser', 'GcalApiIntegration'),
+                      runs=3):
+    """
+    Cold start of each entry module in a fresh interpreter, from python -X importtime, and whether
+    importing it loads the Google client libraries.
+    """
+    results = {}
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for module in modules:
+        code = f"import sys, {module}; print(any(name.startswith('googleapiclient') for name in sys.modules))"
+        timings = []
+        for _ in range(runs):
+            process = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=directory,
+                                     capture_output=True, text=True, check=True)
+            # Last line: "import time: self | cumulative | module", in microseconds
+            last = process.stderr.strip().splitlines()[-1]
+            timings.append(int(last.split('|')[1]) / 1e6)
+        results[module] = {'seconds': min(timings), 'google_loaded': process.stdout.strip() == 'True'}
+        print(f"import {module}: {results[module]['seconds'] * 1000:.1f} ms, "
+              f"google client {'loaded' if results[module]['google_loaded'] else 'not loaded'}")
+    return results
+
+
+def bench_load_test(n_courses=20):
+    """
+    Publishes and deletes a synthetic cart against a fake service with latency, quota and 5xx errors,
+    see LoadTest.
+    """
+    return LoadTest.load_test(n_courses)
+
+
+BENCHMARKS = {
+    'populate_round_trips': bench_populate_round_trips,
+    'token_bucket': bench_token_bucket,
+    'executor_under_quota': bench_executor_under_quota,
+    'load_test': bench_load_test,
+    'sync': bench_sync,
+    'parse_course_cart': bench_parse_course_cart,
+    'parse_engines': bench_parse_engines,
+    'cleaners': bench_cleaners,
+    'create_event': bench_create_event,
+    'serializers': bench_serializers,
+    'occurrences': bench_occurrences,
+    'conflicts': bench_conflicts,
+    'cohort_store': bench_cohort_store,
+    'bulk_parse': bench_bulk_parse,
+    'import_time': bench_import_time,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the benchmarks against local fakes.")
+    parser.add_argument('names', nargs='*', help=f"Benchmarks to run, all by default: {', '.join(BENCHMARKS)}")
+    parser.add_argument('--json', dest='output', default=None,
+                        help="Write the results as JSON to this file, - for stdout")
+    args = parser.parse_args(argv)
+    if unknown := [name for name in args.names if name not in BENCHMARKS]:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+
+    results = {}
+    # With the JSON on stdout, the messages of the benchmarks go to stderr
+    messages = sys.stderr if args.output == '-' else sys.stdout
+    with contextlib.redirect_stdout(messages):
+        for name in args.names or BENCHMARKS:
+            results[name] = BENCHMARKS[name]()
+
+    if args.output:
+        report = {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'results': results,
+        }
+        if args.output == '-':
+            json.dump(report, sys.stdout, indent=2)
+            print()
+        else:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+import argparse
+import glob
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import CourseScheduleParser
+import ModificationOverlay
+import ScheduleCache
+
+"""
+Parses the course carts of a whole cohort at once.
+
+Every *_schedule_list_view.html file is parsed in a process pool and the results are
+streamed, one JSON line per student, to a single output. A cart that fails to parse is
+reported in its own line and does not stop the batch.
+"""
+
+CART_SUFFIX = '_schedule_list_view.html'
+
+
+def find_carts(source):
+    """
+    :param source: Directory holding the cart exports, or a glob pattern. Ex: carts/*.html
+    :return: Sorted list of paths
+    """
+    if os.path.isdir(source):
+        source = os.path.join(source, f"*{CART_SUFFIX}")
+    return sorted(glob.glob(source))
+
+
+def student_name(path):
+    """
+    :param path: Path of a cart export. Ex: carts/jdoe_schedule_list_view.html
+    :return: Name of the student. Ex: jdoe
+    """
+    name = os.path.basename(path)
+    if name.endswith(CART_SUFFIX):
+        return name[:-len(CART_SUFFIX)]
+    return os.path.splitext(name)[0]
+
+
+def parse_file(path, cache_directory=None, overlay_directory=None):
+    """
+    Parses one cart without printing. Runs in the worker processes.
+    :param cache_directory: Directory of the ScheduleCache to use, None for no cache
+    :param overlay_directory: Directory of the modifications of each student, <student>.json,
+    see ModificationOverlay. None for no modifications.
+    :return: (student, courses, error). courses is None when the cart could not be parsed.
+    """
+    try:
+        if cache_directory is not None:
+            cache = ScheduleCache.ScheduleCache(cache_directory)
+            courses = cache.get_or_parse(path, CourseScheduleParser.extract_courses_stream)
+        else:
+            courses = CourseScheduleParser.extract_courses_stream(path)
+        if overlay_directory is not None:
+            overlay = ModificationOverlay.Overlay.load(os.path.join(overlay_directory, f"{student_name(path)}.json"))
+            courses, _ = overlay.apply(courses)
+        courses = CourseScheduleParser.shift_start_date(courses)
+    except Exception as err:
+        return student_name(path), None, f"{type(err).__name__}: {err}"
+    return student_name(path), courses, None
+
+
+def iter_parsed(paths, workers=None, chunksize=4, cache_directory=None, overlay_directory=None):
+    """
+    Parses the carts across a process pool, yielding the results in the order of paths as they come.
+    :param paths: Paths of the cart exports
+    :param workers: Number of processes, one per core when None
+    :param chunksize: Number of carts sent to a worker at once
+    :param cache_directory: Directory of the ScheduleCache to use, None for no cache
+    :param overlay_directory: Directory of the modifications of each student, None for no modifications
+    :return: Generator of (path, student, courses, error)
+    """
+    paths = list(paths)
+    parse = partial(parse_file, cache_directory=cache_directory, overlay_directory=overlay_directory)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for path, (student, courses, error) in zip(paths, pool.map(parse, paths, chunksize=chunksize)):
+            yield path, student, courses, error
+
+
+def write_jsonl(results, output):
+    """
+    Writes one JSON line per student.
+    :param results: Iterable of (path, student, courses, error), see iter_parsed
+    :param output: Open text file
+    :return: (number of parsed carts, number of failed carts)
+    """
+    parsed = failed = 0
+    for path, student, courses, error in results:
+        record = {'student': student, 'file': path}
+        if error is None:
+            record['courses'] = courses
+            parsed += 1
+        else:
+            record['error'] = error
+            failed += 1
+            print(f"Failed to parse {path}. Error: {error}", file=sys.stderr)
+        output.write(json.dumps(record, cls=CourseScheduleParser.ClassEncoder) + '\n')
+    return parsed, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parse many course carts into one JSON Lines file.")
+    parser.add_argument('source', help="Directory of *_schedule_list_view.html files, or a glob pattern")
+    parser.add_argument('-o', '--output', default='-', help="Output file, - for stdout")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="Number of processes, one per core by default")
+    parser.add_argument('--cache', default=None, help="Directory of the parsed schedule cache, no cache by default")
+    parser.add_argument('--overlays', default=None,
+                        help="Directory of <student>.json modifications to apply, see ModificationOverlay")
+    args = parser.parse_args(argv)
+
+    paths = find_carts(args.source)
+    output = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        parsed, failed = write_jsonl(iter_parsed(paths, args.workers, cache_directory=args.cache,
+                                                 overlay_directory=args.overlays), output)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    print(f"Parsed {parsed} carts, {failed} failed", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
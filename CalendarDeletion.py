@@ -0,0 +1,170 @@
+import datetime
+import re
+from zoneinfo import ZoneInfo
+
+from EventBuilder import TOOL_NAME, TOOL_PROPERTY
+from GcalApiIntegration import MAX_BATCH_SIZE, run_request, run_requests
+
+"""
+Deletes the events created by this tool, one recurring series at a time.
+
+The date window is sent to the API with timeMin/timeMax and only the series masters are
+listed, so a whole term is wiped with one delete per class instead of one per class meeting.
+"""
+
+TIME_ZONE = ZoneInfo('America/Montreal')
+UNTIL_PATTERN = re.compile(r'UNTIL=(\d{8}T\d{6})Z?')
+
+
+def to_local_datetime(value):
+    """
+    :param value: datetime.date, datetime.datetime or ISO string. Naive values are in Montreal time.
+    :return: Aware datetime.datetime in Montreal time
+    """
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    if not isinstance(value, datetime.datetime):
+        value = datetime.datetime.combine(value, datetime.time())
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=TIME_ZONE)
+    return value.astimezone(TIME_ZONE)
+
+
+def series_bounds(event):
+    """
+    :param event: Event dict from the API
+    :return: (start, end) aware datetimes of the first occurrence and the UNTIL of the series.
+    end is None for series without an UNTIL.
+    """
+    start = event['start']
+    start = to_local_datetime(start.get('dateTime', start.get('date')))
+    if 'recurrence' not in event:
+        return start, start
+    for rule in event['recurrence']:
+        if rule.startswith('RRULE') and (until := UNTIL_PATTERN.search(rule)):
+            until = datetime.datetime.strptime(until.group(1), '%Y%m%dT%H%M%S')
+            return start, until.replace(tzinfo=datetime.timezone.utc).astimezone(TIME_ZONE)
+    return start, None
+
+
+def list_tool_series(calendarId, service, time_min=None, time_max=None, executor=None):
+    """
+    Lists the series created by this tool that have occurrences in the window, following every page.
+    Their exceptions (the occurrences edited in Google Calendar) are left out.
+    :return: List of event dicts
+    """
+    params = {
+        'calendarId': calendarId,
+        'privateExtendedProperty': f"{TOOL_PROPERTY}={TOOL_NAME}",
+        'maxResults': 2500,
+    }
+    if time_min is not None:
+        params['timeMin'] = time_min.isoformat()
+    if time_max is not None:
+        params['timeMax'] = time_max.isoformat()
+
+    events = []
+    page_token = None
+    while True:
+        response = run_request(service.events().list(pageToken=page_token, **params), executor)
+        # The exceptions of a series (its edited occurrences) go with it
+        events.extend(event for event in response.get('items', []) if 'recurringEventId' not in event)
+        if not (page_token := response.get('nextPageToken')):
+            return events
+
+
+def truncate_recurrence(recurrence, until):
+    """
+    Moves the UNTIL of the RRULE so the series stops before until.
+    :return: New recurrence list
+    """
+    until = (until.astimezone(datetime.timezone.utc) - datetime.timedelta(seconds=1)).strftime('%Y%m%dT%H%M%SZ')
+    return [UNTIL_PATTERN.sub(f'UNTIL={until}', rule) if rule.startswith('RRULE') else rule
+            for rule in recurrence]
+
+
+def cleared_hash(event):
+    """
+    :param event: Event dict from the API
+    :return: extendedProperties of the event without its content hash, for a patch. The next sync
+    sees the series as changed and sends it whole again, see CalendarSync.diff_events.
+    """
+    properties = event.get('extendedProperties', {})
+    return dict(properties, private=dict(properties.get('private', {}), hash=None))
+
+
+def delete_events(calendarId, service, time_min=None, time_max=None, existing=None, batch_size=MAX_BATCH_SIZE,
+                  executor=None, journal=None):
+    """
+    Deletes every occurrence in [time_min, time_max) of the events created by this tool.
+
+    - A series entirely in the window is deleted with one call.
+    - A series that starts before time_min and ends in the window is cut with one patch of its UNTIL.
+    - Only a series that goes past time_max has its instances in the window deleted one by one.
+    The series that are cut or lose instances have their content hash cleared, so a sync of the
+    cart brings them back.
+    :param calendarId: Calendar to delete from
+    :param service: Calendar service
+    :param time_min: datetime.date, datetime.datetime or ISO string. None for no lower bound
+    :param time_max: datetime.date, datetime.datetime or ISO string. None for no upper bound
+    :param existing: Events already known, ex: CalendarSnapshot.tool_events(). Only used without a window,
+    otherwise the window is sent to the API.
+    :param batch_size: Number of calls per batch request
+    :param executor: CalendarExecutor.RequestExecutor used for the calls
+    :param journal: SyncJournal.SyncJournal of the calendar, the deleted series are removed from it
+    :return: Dict with the number of deleted series, truncated series, deleted instances and the errors
+    """
+    time_min = to_local_datetime(time_min) if time_min is not None else None
+    time_max = to_local_datetime(time_max) if time_max is not None else None
+    if existing is None or time_min is not None or time_max is not None:
+        existing = list_tool_series(calendarId, service, time_min, time_max, executor)
+
+    events = service.events()
+    deletes, truncates, partial = [], [], []
+    # Ids of the series in deletes
+    deleted = []
+    for event in existing:
+        start, end = series_bounds(event)
+        if time_max is not None and (end is None or end >= time_max):
+            partial.append(event)
+        elif time_min is not None and start < time_min and 'recurrence' in event:
+            truncates.append(events.patch(calendarId=calendarId, eventId=event['id'], body={
+                'recurrence': truncate_recurrence(event['recurrence'], time_min),
+                'extendedProperties': cleared_hash(event),
+            }))
+        else:
+            deletes.append(events.delete(calendarId=calendarId, eventId=event['id']))
+            deleted.append(event['id'])
+
+    instance_deletes, marks = [], []
+    for event in partial:
+        page_token = None
+        listed = len(instance_deletes)
+        while True:
+            response = run_request(events.instances(
+                calendarId=calendarId,
+                eventId=event['id'],
+                timeMin=time_min.isoformat() if time_min is not None else None,
+                timeMax=time_max.isoformat(),
+                pageToken=page_token,
+            ), executor)
+            instance_deletes += [events.delete(calendarId=calendarId, eventId=instance['id'])
+                                 for instance in response.get('items', [])]
+            if not (page_token := response.get('nextPageToken')):
+                break
+        if len(instance_deletes) > listed:
+            marks.append(events.patch(calendarId=calendarId, eventId=event['id'],
+                                      body={'extendedProperties': cleared_hash(event)}))
+
+    results = run_requests(service, deletes + truncates + instance_deletes + marks, batch_size, executor)
+    if journal is not None:
+        for event_id, (_, error) in zip(deleted, results):
+            if error is None:
+                journal.forget_event(event_id)
+        journal.flush()
+    return {
+        'deleted_series': len(deletes),
+        'truncated_series': len(truncates),
+        'deleted_instances': len(instance_deletes),
+        'errors': [error for _, error in results if error is not None],
+    }
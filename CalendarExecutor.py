@@ -0,0 +1,240 @@
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import Instrumentation
+
+"""
+Shared executor for Calendar API calls.
+
+Runs the calls on a thread pool, keeps under the Calendar quota with a token bucket and
+retries the transient errors (rate limits, 5xx and network errors) with jittered exponential backoff,
+so one rateLimitExceeded in the middle of a push no longer aborts the whole run.
+"""
+
+# Calendar allows about 600 queries per minute per user
+DEFAULT_RATE = 10
+DEFAULT_BURST = 10
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded', 'quotaExceeded'}
+
+
+def is_transient(error):
+    """
+    :param error: Exception raised by a call
+    :return: True if the call can succeed when tried again later
+    """
+    import httplib2
+    from googleapiclient.errors import HttpError
+    if isinstance(error, (OSError, httplib2.HttpLib2Error)):
+        # Timeouts, reset connections and the like
+        return True
+    if not isinstance(error, HttpError):
+        return False
+    status = error.resp.status
+    if status in RETRY_STATUSES:
+        return True
+    if status == 403:
+        try:
+            reasons = {e.get('reason') for e in json.loads(error.content)['error']['errors']}
+        except (ValueError, KeyError, TypeError):
+            return False
+        return bool(reasons & RATE_LIMIT_REASONS)
+    return False
+
+
+class TokenBucket:
+    """
+    Lets through rate calls per second on average, with bursts of up to capacity calls.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, capacity=DEFAULT_BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """
+        Blocks until tokens calls are allowed. A cost above capacity, ex: a batch of 50 calls,
+        is paid in slices of capacity tokens, so batches count as many calls as they hold.
+        """
+        while tokens > 0:
+            part = min(tokens, self.capacity)
+            self._acquire(part)
+            tokens -= part
+
+    def _acquire(self, tokens):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class Metrics:
+    """
+    Counts calls, retries and failures and keeps the latency of every attempt.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.latencies = []
+        self.lock = threading.Lock()
+
+    def record(self, latency, retry=False, failure=False):
+        with self.lock:
+            self.calls += 1
+            self.retries += retry
+            self.failures += failure
+            self.latencies.append(latency)
+
+    def percentile(self, p):
+        """
+        :param p: Percentile between 0 and 100
+        :return: Latency in seconds, 0 when nothing was recorded
+        """
+        with self.lock:
+            latencies = sorted(self.latencies)
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))]
+
+    def summary(self):
+        return {
+            'calls': self.calls,
+            'retries': self.retries,
+            'failures': self.failures,
+            'p50_ms': round(self.percentile(50) * 1000, 2),
+            'p99_ms': round(self.percentile(99) * 1000, 2),
+        }
+
+
+class RequestExecutor:
+    """
+    Runs Calendar API requests concurrently, rate limited and with retries.
+    """
+
+    def __init__(self, max_workers=8, rate=DEFAULT_RATE, burst=DEFAULT_BURST, max_retries=5,
+                 base_delay=1.0, max_delay=32.0, http_factory=None):
+        """
+        :param max_workers: Number of calls in flight at the same time
+        :param rate: Calls per second allowed by the token bucket
+        :param burst: Size of the token bucket
+        :param max_retries: Number of retries of a transient error before giving up
+        :param base_delay: First backoff delay in seconds, doubled at every retry
+        :param max_delay: Longest backoff delay in seconds
+        :param http_factory: Function returning a new authorized http object. httplib2 is not
+        thread safe, so every worker thread gets its own. When None, the request's own http is used.
+        """
+        self.max_workers = max_workers
+        self.bucket = TokenBucket(rate, burst)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.http_factory = http_factory
+        self.metrics = Metrics()
+        self._local = threading.local()
+
+    def _http(self):
+        if self.http_factory is None:
+            return None
+        if not hasattr(self._local, 'http'):
+            self._local.http = self.http_factory()
+        return self._local.http
+
+    def backoff(self, attempt, error=None):
+        """
+        :return: Seconds to wait before the retry. Full jitter, or the Retry-After header when Google sends one.
+        """
+        if (resp := getattr(error, 'resp', None)) is not None and (retry_after := resp.get('retry-after')):
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def execute(self, request, tokens=1):
+        """
+        Executes one request, or one batch request worth tokens calls, retrying transient errors.
+        :return: The response of the request
+        """
+        attempt = 0
+        while True:
+            self.bucket.acquire(tokens)
+            Instrumentation.count('api.calls', tokens)
+            start = time.perf_counter()
+            try:
+                http = self._http()
+                with Instrumentation.span('api.call', tokens=tokens, attempt=attempt):
+                    response = request.execute(http=http) if http is not None else request.execute()
+            except Exception as err:
+                retry = is_transient(err) and attempt < self.max_retries
+                self.metrics.record(time.perf_counter() - start, retry=retry, failure=not retry)
+                if not retry:
+                    raise
+                Instrumentation.count('api.retries')
+                time.sleep(self.backoff(attempt, err))
+                attempt += 1
+            else:
+                self.metrics.record(time.perf_counter() - start)
+                return response
+
+    def run_all(self, requests):
+        """
+        Executes the requests concurrently.
+        :return: List of (response, error) tuples in the same order as requests
+        """
+
+        def run(request):
+            try:
+                return self.execute(request), None
+            except Exception as err:
+                return None, err
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            return list(pool.map(run, requests))
+
+    def run_batched(self, service, requests, batch_size):
+        """
+        Sends the requests in batch requests executed concurrently.
+        The calls of a batch that fail with a transient error are retried one by one. A batch that
+        fails as a whole fails its calls, the other batches go on.
+        :return: List of (response, error) tuples in the same order as requests
+        """
+        chunks = [list(range(start, min(start + batch_size, len(requests))))
+                  for start in range(0, len(requests), batch_size)]
+        results = [(None, None)] * len(requests)
+
+        def run(chunk):
+            def callback(request_id, response, exception):
+                results[int(request_id)] = (response, exception)
+
+            batch = service.new_batch_http_request(callback=callback)
+            for i in chunk:
+                batch.add(requests[i], request_id=str(i))
+            try:
+                self.execute(batch, tokens=len(chunk))
+            except Exception as err:
+                for i in chunk:
+                    results[i] = (None, err)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            list(pool.map(run, chunks))
+
+        retry = [i for i, (_, error) in enumerate(results) if is_transient(error)]
+        with self.metrics.lock:
+            self.metrics.retries += len(retry)
+        for i, result in zip(retry, self.run_all([requests[i] for i in retry])):
+            results[i] = result
+        return results
@@ -0,0 +1,103 @@
+import json
+import os.path
+
+from googleapiclient.errors import HttpError
+
+from EventBuilder import TOOL_NAME, TOOL_PROPERTY
+from GcalApiIntegration import run_request
+
+"""
+Local copy of the events of a calendar, kept up to date with the API's sync tokens.
+
+The first refresh lists the whole calendar. Every refresh after that only downloads
+what changed since the previous one, so the delete and sync logic can read the calendar
+without listing it again.
+"""
+
+
+class CalendarSnapshot:
+    """
+    Events of one calendar (series, not expanded instances), persisted to a JSON file.
+    """
+
+    def __init__(self, calendarId, path='calendar_snapshot.json'):
+        self.calendarId = calendarId
+        self.path = path
+        self.sync_token = None
+        self.items = {}
+        self.load()
+
+    def load(self):
+        """
+        Loads the snapshot from disk. A snapshot of another calendar is ignored.
+        """
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r') as f:
+            data = json.load(f)
+        if data.get('calendarId') != self.calendarId:
+            return
+        self.sync_token = data.get('syncToken')
+        self.items = data.get('items', {})
+
+    def save(self):
+        """
+        Writes the snapshot to a temporary file first so that a crash never leaves a half written snapshot.
+        """
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'calendarId': self.calendarId, 'syncToken': self.sync_token, 'items': self.items}, f)
+        os.replace(tmp_path, self.path)
+
+    def refresh(self, service, executor=None):
+        """
+        Brings the snapshot up to date. Uses the sync token of the previous refresh when there is one,
+        and falls back to a full listing when Google expired it (410 Gone).
+        :param service: Calendar service
+        :param executor: CalendarExecutor.RequestExecutor used for the calls
+        :return: Number of changed events downloaded
+        """
+        try:
+            changed = self._list_changes(service, executor)
+        except HttpError as err:
+            if err.resp.status != 410:
+                raise
+            self.sync_token = None
+            self.items = {}
+            changed = self._list_changes(service, executor)
+        self.save()
+        return changed
+
+    def _list_changes(self, service, executor):
+        changed = 0
+        page_token = None
+        while True:
+            params = {'calendarId': self.calendarId, 'pageToken': page_token, 'maxResults': 2500}
+            if self.sync_token:
+                # Deleted events only come back as cancelled entries with showDeleted
+                params.update(syncToken=self.sync_token, showDeleted=True)
+            response = run_request(service.events().list(**params), executor)
+            for event in response.get('items', []):
+                changed += 1
+                if event.get('status') == 'cancelled':
+                    self.items.pop(event['id'], None)
+                else:
+                    self.items[event['id']] = event
+            if not (page_token := response.get('nextPageToken')):
+                self.sync_token = response.get('nextSyncToken')
+                return changed
+
+    def events(self):
+        """
+        :return: List of all events in the snapshot
+        """
+        return list(self.items.values())
+
+    def tool_events(self):
+        """
+        :return: List of the series created by this tool. The exceptions of a series (an occurrence
+        edited in Google Calendar) carry the properties of the series too, they are left out.
+        """
+        return [event for event in self.items.values()
+                if event.get('extendedProperties', {}).get('private', {}).get(TOOL_PROPERTY) == TOOL_NAME
+                and 'recurringEventId' not in event]
@@ -0,0 +1,129 @@
+from EventBuilder import TOOL_NAME, TOOL_PROPERTY, create_event, event_hash, keyed_blocks
+from GcalApiIntegration import MAX_BATCH_SIZE, run_request, run_requests
+
+"""
+Incremental sync between the parsed courses and the calendar.
+
+Each event created by this tool carries its TimeBlock key and a content hash in its
+private extended properties. A sync compares the desired events with the ones already
+in the calendar and only sends the inserts, patches and deletes that are needed.
+"""
+
+
+def desired_events(courses, closures=None, keys=None):
+    """
+    Builds the event body of every TimeBlock, keyed by its stable identity, see keyed_blocks.
+    :param courses: Dict of Course objects
+    :param closures: ParseAcademicCalendar.ClosureIndex of the days the classes are cancelled
+    :param keys: Only build the bodies of these keys, all of them when None
+    :return: Dict of key -> event body with the key and hash in its extended properties
+    """
+    desired = {}
+    for key, course, event in keyed_blocks(courses):
+        if keys is not None and key not in keys:
+            continue
+        body = create_event(course, event, closures)
+        private = body['extendedProperties']['private']
+        private['key'] = key
+        private['hash'] = event_hash(body)
+        desired[key] = body
+    return desired
+
+
+def list_tool_events(calendarId, service, executor=None):
+    """
+    Lists the recurring events (series, not instances) created by this tool, following every page.
+    Their exceptions (the occurrences edited in Google Calendar) are left out.
+    :return: List of event dicts
+    """
+    events = []
+    page_token = None
+    while True:
+        response = run_request(service.events().list(
+            calendarId=calendarId,
+            privateExtendedProperty=f"{TOOL_PROPERTY}={TOOL_NAME}",
+            pageToken=page_token,
+        ), executor)
+        events.extend(event for event in response.get('items', []) if 'recurringEventId' not in event)
+        if not (page_token := response.get('nextPageToken')):
+            return events
+
+
+def diff_events(desired, existing):
+    """
+    Compares the desired events with the ones in the calendar.
+    :param desired: Dict of key -> event body, see desired_events
+    :param existing: List of events from the calendar. The exceptions of a series (the occurrences
+    edited in Google Calendar, they have a recurringEventId) are left alone.
+    :return: (inserts, patches, deletes, unchanged). inserts: list of bodies,
+    patches: list of (event id, body), deletes: list of event ids, unchanged: int
+    """
+    inserts, patches, deletes = [], [], []
+    unchanged = 0
+    seen = set()
+    for event in existing:
+        if 'recurringEventId' in event:
+            # An occurrence edited in Google Calendar, it carries the key of its series
+            continue
+        private = event.get('extendedProperties', {}).get('private', {})
+        key = private.get('key')
+        if key not in desired or key in seen:
+            # No longer in the cart, or a duplicate left by an older run
+            deletes.append(event['id'])
+            continue
+        seen.add(key)
+        if private.get('hash') == desired[key]['extendedProperties']['private']['hash']:
+            unchanged += 1
+        else:
+            patches.append((event['id'], desired[key]))
+    inserts = [body for key, body in desired.items() if key not in seen]
+    return inserts, patches, deletes, unchanged
+
+
+def sync_events(calendarId, courses, service, batch_size=MAX_BATCH_SIZE, existing=None, executor=None,
+                journal=None, closures=None, keys=None):
+    """
+    Makes the calendar match the courses with as few API calls as possible.
+    :param calendarId: Calendar to sync
+    :param courses: Dict of Course objects
+    :param service: Calendar service
+    :param batch_size: Number of calls per batch request
+    :param existing: Events already in the calendar, listed from the API when None
+    :param executor: CalendarExecutor.RequestExecutor used for the calls
+    :param journal: SyncJournal.SyncJournal of the calendar, updated with the result of every call
+    :param closures: ParseAcademicCalendar.ClosureIndex of the days the classes are cancelled
+    :param keys: Only sync the TimeBlocks with these keys, the other events of the calendar are left
+    as they are. Everything when None.
+    :return: Dict with the number of inserted, patched, deleted and unchanged events, and the errors
+    """
+    if existing is None:
+        existing = list_tool_events(calendarId, service, executor)
+    if keys is not None:
+        existing = [event for event in existing
+                    if event.get('extendedProperties', {}).get('private', {}).get('key') in keys]
+    inserts, patches, deletes, unchanged = diff_events(desired_events(courses, closures, keys), existing)
+
+    events = service.events()
+    requests = [events.insert(calendarId=calendarId, body=body) for body in inserts]
+    requests += [events.patch(calendarId=calendarId, eventId=event_id, body=body) for event_id, body in patches]
+    requests += [events.delete(calendarId=calendarId, eventId=event_id) for event_id in deletes]
+
+    results = run_requests(service, requests, batch_size, executor)
+    errors = [error for _, error in results if error is not None]
+
+    if journal is not None:
+        for body, (response, error) in zip(inserts + [body for _, body in patches], results):
+            if error is None:
+                private = body['extendedProperties']['private']
+                journal.record(private['key'], response['id'], private['hash'])
+        for event_id, (_, error) in zip(deletes, results[len(inserts) + len(patches):]):
+            if error is None:
+                journal.forget_event(event_id)
+        journal.flush()
+    return {
+        'inserted': len(inserts),
+        'patched': len(patches),
+        'deleted': len(deletes),
+        'unchanged': unchanged,
+        'errors': errors,
+    }
@@ -0,0 +1,155 @@
+import logging
+import os
+import time
+
+from EventBuilder import keyed_blocks
+
+"""
+Watch mode: keeps a calendar in sync with a cart export and its modifications file.
+
+The files are polled for a new modification time or size. A change is only handled once the
+files have stayed the same for the debounce delay, so a burst of writes (a browser saving the
+export, an editor saving the overrides) gives a single sync. The cart is parsed again, compared
+course by course with the previous parse, and only the TimeBlocks of the courses that changed
+are sent to the calendar.
+"""
+
+DEFAULT_INTERVAL = 0.5
+DEFAULT_DEBOUNCE = 1.0
+
+logger = logging.getLogger(__name__)
+
+
+class FileWatcher:
+    """
+    Polls a few files for changes.
+    """
+
+    def __init__(self, paths, interval=DEFAULT_INTERVAL, debounce=DEFAULT_DEBOUNCE):
+        """
+        :param paths: Files to watch, they may not exist yet
+        :param interval: Seconds between two polls
+        :param debounce: Seconds the files must stay unchanged before a change is reported
+        """
+        self.paths = list(paths)
+        self.interval = interval
+        self.debounce = debounce
+        self.stamps = self.stat()
+
+    def stat(self):
+        """
+        :return: Dict of path -> (modification time, size), None for a missing file
+        """
+        stamps = {}
+        for path in self.paths:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                stamps[path] = None
+            else:
+                stamps[path] = (stat.st_mtime_ns, stat.st_size)
+        return stamps
+
+    def sleep(self, stop):
+        """
+        :return: True when stop was set during the interval
+        """
+        if stop is None:
+            time.sleep(self.interval)
+            return False
+        return stop.wait(self.interval)
+
+    def wait(self, stop=None):
+        """
+        Blocks until a change has settled.
+        :param stop: threading.Event ending the wait
+        :return: Set of the changed paths, None when stopped
+        """
+        while True:
+            if self.sleep(stop):
+                return None
+            stamps = self.stat()
+            if stamps == self.stamps:
+                continue
+            # Coalesce the burst: wait until nothing moved for the debounce delay
+            settled = time.monotonic()
+            while time.monotonic() - settled < self.debounce:
+                if self.sleep(stop):
+                    return None
+                if (latest := self.stat()) != stamps:
+                    stamps = latest
+                    settled = time.monotonic()
+            changed = {path for path in self.paths if stamps[path] != self.stamps[path]}
+            self.stamps = stamps
+            return changed
+
+
+def changed_courses(previous, current):
+    """
+    :param previous: Dict of Course objects of the last parse
+    :param current: Dict of Course objects of the new parse
+    :return: Set of the titles of the courses added, removed or changed
+    """
+    return {title for title in previous.keys() | current.keys() if previous.get(title) != current.get(title)}
+
+
+def course_keys(courses, titles):
+    """
+    :param titles: Keys of the courses in the dict, as returned by changed_courses. The overrides
+    may change the title of a Course, so it can differ from its key.
+    :return: Set of the keys of the TimeBlocks of these courses, see keyed_blocks
+    """
+    selected = {id(course) for title, course in courses.items() if title in titles}
+    return {key for key, course, _ in keyed_blocks(courses) if id(course) in selected}
+
+
+def watch(paths, load, publish, interval=DEFAULT_INTERVAL, debounce=DEFAULT_DEBOUNCE, stop=None):
+    """
+    Syncs everything once, then only the courses that change, until stop is set.
+    A failed sync, one that raised or reported errors, is logged and its courses are sent again
+    with the next change.
+    :param paths: Files to watch, the cart and its modifications
+    :param load: Function(changed) returning the dict of Course objects. changed is the set of the paths
+    that changed, None for the first load, so the cart is only parsed again when it changed
+    :param publish: Function(courses, keys) sending the TimeBlocks with these keys to the calendar,
+    all of them when keys is None, and returning a report with the failed calls in 'errors'.
+    Ex: a partial of GcalApiIntegration.publish
+    :param stop: threading.Event ending the watch, runs forever when None
+    """
+    # Stat the files first, so an edit saved during the first sync is seen
+    watcher = FileWatcher(paths, interval, debounce)
+    # Courses as the calendar last received them, None until a full sync went through
+    synced = None
+    current = load(None)
+    changed = None
+    while True:
+        if synced is None:
+            keys, titles = None, None
+        else:
+            titles = changed_courses(synced, current)
+            keys = course_keys(synced, titles) | course_keys(current, titles)
+        if titles == set():
+            logger.info("%s changed, no course did", ', '.join(sorted(changed)))
+        else:
+            names = 'every course' if titles is None else ', '.join(sorted(titles))
+            try:
+                report = publish(current, keys)
+            except Exception as err:
+                logger.error("Failed to sync %s, will retry on the next change. Error: %s", names, err)
+            else:
+                if report['errors']:
+                    # The calls that failed are not in the calendar, keep them among the changes
+                    logger.error("Failed to sync %s, will retry on the next change: %s", names, report)
+                else:
+                    logger.info("Synced %s: %s", names, report)
+                    synced = current
+
+        while True:
+            if (changed := watcher.wait(stop)) is None:
+                return
+            try:
+                current = load(changed)
+                break
+            except Exception as err:
+                # Ex: the export is still being written, the next change will try again
+                logger.error("Failed to parse after the change of %s. Error: %s", ', '.join(sorted(changed)), err)
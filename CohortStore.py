@@ -0,0 +1,357 @@
+import argparse
+import json
+import os
+import sys
+from datetime import date, time
+
+import numpy as np
+
+from CourseScheduleParser import DAY_MAPPING, LOCATION
+
+"""
+Columnar store of the schedules of a cohort, for queries over thousands of students.
+
+Every TimeBlock of every student is one row. The strings (student, course, building, room,
+instructor...) are dictionary encoded: each column holds int32 codes into a sorted array of its
+distinct values, so looking a value up is a binary search. Dates are datetime64[D], times are
+minutes since midnight and the days a bitmask (bit DAY_MAPPING[day]).
+
+Each encoded column has an inverted index (the rows sorted by code and where each code starts),
+and every weekday an index of its rows sorted by start time, so a query only reads the rows it
+returns. Everything is saved as .npy files that open() memory maps, without parsing anything.
+
+    python CohortStore.py build carts/ -o cohort
+    python CohortStore.py query cohort --room H521 --day WE --at 18:30
+    python CohortStore.py query cohort --building EV --count
+"""
+
+VERSION = 1
+# Dictionary encoded columns. course is the Course title, building the TimeBlock address
+STRING_COLUMNS = ('student', 'course', 'class_number', 'section', 'component', 'building', 'room', 'instructor')
+NUMBER_COLUMNS = ('start_date', 'end_date', 'start_time', 'end_time', 'days')
+META_FILE = 'store.json'
+
+
+def minutes(value):
+    """
+    :param value: datetime.time, or None
+    :return: Minutes since midnight, -1 for None
+    """
+    return -1 if value is None else value.hour * 60 + value.minute
+
+
+def day_mask(days):
+    """
+    :param days: Iterable of days. Ex: ('MO', 'WE')
+    :return: Bitmask of the days. Ex: 0b101
+    """
+    mask = 0
+    for day in days or ():
+        mask |= 1 << DAY_MAPPING[day]
+    return mask
+
+
+def building_address(building):
+    """
+    :param building: Address, or a short name of LOCATION. Ex: H, EV
+    :return: Value of the building column. Ex: 1455 de Maisonneuve Boulevard West
+    """
+    return LOCATION.get(building, building)
+
+
+def inverted_index(codes, size):
+    """
+    :param codes: Array of the codes of a column
+    :param size: Number of distinct values
+    :return: (order, offsets). The rows with code c are order[offsets[c]:offsets[c + 1]], in increasing order.
+    """
+    order = np.argsort(codes, kind='stable').astype(np.int32)
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(codes, minlength=size)))).astype(np.int64)
+    return order, offsets
+
+
+class CohortStore:
+    """
+    Parallel arrays, one entry per TimeBlock, with their dictionaries and indexes.
+    columns: name -> array. values: name -> sorted array of the strings of an encoded column.
+    """
+
+    def __init__(self, columns, values, indexes=None):
+        """
+        :param columns: Dict of column name -> array
+        :param values: Dict of encoded column name -> sorted array of its strings
+        :param indexes: Dict of index name -> array, built from the columns when None
+        """
+        self.columns = columns
+        self.values = values
+        self.indexes = indexes if indexes is not None else self.build_indexes()
+
+    def __len__(self):
+        return len(self.columns['student'])
+
+    @classmethod
+    def build(cls, schedules):
+        """
+        :param schedules: Iterable of (student, courses), courses as returned by parse_course_cart
+        :return: CohortStore
+        """
+        strings = {name: [] for name in STRING_COLUMNS}
+        numbers = {name: [] for name in NUMBER_COLUMNS}
+        for student, courses in schedules:
+            for course in courses.values():
+                for event in course.events:
+                    for name, value in (('student', student), ('course', course.title),
+                                        ('class_number', event.class_number), ('section', event.section),
+                                        ('component', event.component), ('building', event.address),
+                                        ('room', event.room), ('instructor', event.instructor)):
+                        strings[name].append('' if value is None else str(value))
+                    numbers['start_date'].append(event.start_date)
+                    numbers['end_date'].append(event.end_date)
+                    numbers['start_time'].append(minutes(event.start_time))
+                    numbers['end_time'].append(minutes(event.end_time))
+                    numbers['days'].append(day_mask(event.days))
+
+        columns, values = {}, {}
+        for name, column in strings.items():
+            # Sorted distinct values, and the position of each row's value among them
+            values[name], codes = np.unique(np.array(column, dtype=str), return_inverse=True)
+            columns[name] = codes.astype(np.int32)
+        columns['start_date'] = np.array(numbers['start_date'], dtype='datetime64[D]')
+        columns['end_date'] = np.array(numbers['end_date'], dtype='datetime64[D]')
+        columns['start_time'] = np.array(numbers['start_time'], dtype=np.int16)
+        columns['end_time'] = np.array(numbers['end_time'], dtype=np.int16)
+        columns['days'] = np.array(numbers['days'], dtype=np.uint8)
+        return cls(columns, values)
+
+    def build_indexes(self):
+        """
+        :return: Dict of index name -> array: <column>.order and <column>.offsets of every encoded
+        column, days.order and days.offsets of the rows of each weekday sorted by start time
+        """
+        indexes = {}
+        for name in STRING_COLUMNS:
+            indexes[f'{name}.order'], indexes[f'{name}.offsets'] = inverted_index(self.columns[name],
+                                                                                   len(self.values[name]))
+        days, starts = self.columns['days'], self.columns['start_time']
+        per_day = []
+        for weekday in range(7):
+            rows = np.flatnonzero(days & (1 << weekday))
+            per_day.append(rows[np.argsort(starts[rows], kind='stable')])
+        indexes['days.order'] = np.concatenate(per_day).astype(np.int32)
+        indexes['days.offsets'] = np.concatenate(([0], np.cumsum([len(rows) for rows in per_day]))).astype(np.int64)
+        return indexes
+
+    def save(self, directory):
+        """
+        Writes one .npy file per column, dictionary and index. store.json is written last,
+        so a store that was not fully written does not open.
+        """
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(meta_path := os.path.join(directory, META_FILE)):
+            os.remove(meta_path)
+        arrays = {**self.columns, **{f'{name}.values': values for name, values in self.values.items()},
+                  **self.indexes}
+        for name, array in arrays.items():
+            np.save(os.path.join(directory, f'{name}.npy'), array)
+        with open(meta_path, 'w') as f:
+            json.dump({'version': VERSION, 'rows': len(self), 'arrays': sorted(arrays)}, f)
+
+    @classmethod
+    def open(cls, directory):
+        """
+        :return: CohortStore of the directory, its arrays memory mapped and read on demand
+        """
+        with open(os.path.join(directory, META_FILE), 'r') as f:
+            meta = json.load(f)
+        if meta.get('version') != VERSION:
+            raise ValueError(f"{directory} holds a store of version {meta.get('version')}, expected {VERSION}")
+        arrays = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r') for name in meta['arrays']}
+        columns = {name: arrays[name] for name in STRING_COLUMNS + NUMBER_COLUMNS}
+        values = {name: arrays[f'{name}.values'] for name in STRING_COLUMNS}
+        indexes = {name: array for name, array in arrays.items() if name.endswith(('.order', '.offsets'))}
+        return cls(columns, values, indexes)
+
+    def code(self, column, value):
+        """
+        :return: Code of the value in the encoded column, None when no row has it
+        """
+        values = self.values[column]
+        i = int(np.searchsorted(values, value))
+        return i if i < len(values) and values[i] == value else None
+
+    def rows(self, column, value):
+        """
+        :param column: Encoded column. Ex: room
+        :param value: Ex: H521
+        :return: Sorted array of the rows with the value
+        """
+        if (code := self.code(column, value)) is None:
+            return np.array([], dtype=np.int32)
+        offsets = self.indexes[f'{column}.offsets']
+        return np.asarray(self.indexes[f'{column}.order'][offsets[code]:offsets[code + 1]])
+
+    def by_room(self, room, building=None):
+        rows = self.rows('room', room)
+        if building is not None:
+            rows = np.intersect1d(rows, self.by_building(building), assume_unique=True)
+        return rows
+
+    def by_building(self, building):
+        return self.rows('building', building_address(building))
+
+    def by_instructor(self, instructor):
+        return self.rows('instructor', instructor)
+
+    def by_course(self, title):
+        return self.rows('course', title)
+
+    def at(self, day=None, when=None, on=None):
+        """
+        Rows of the classes in session at a time slot.
+        :param day: Day of the week. Ex: WE. The day of on when None
+        :param when: datetime.time, the classes starting at or before it and ending after it.
+        Every class of the day when None
+        :param on: datetime.date, only the classes held that day, between their start and end dates
+        :return: Sorted array of rows
+        """
+        if day is None:
+            if on is None:
+                raise ValueError("Give the day, the date or both")
+            weekday = on.weekday()
+        else:
+            weekday = DAY_MAPPING[day]
+        offsets = self.indexes['days.offsets']
+        rows = np.asarray(self.indexes['days.order'][offsets[weekday]:offsets[weekday + 1]])
+        if when is not None:
+            t = minutes(when)
+            # Sorted by start time: the classes started by then are a prefix
+            rows = rows[:np.searchsorted(self.columns['start_time'][rows], t, side='right')]
+            rows = rows[self.columns['end_time'][rows] > t]
+        if on is not None:
+            on = np.datetime64(on, 'D')
+            rows = rows[(self.columns['start_date'][rows] <= on) & (self.columns['end_date'][rows] >= on)]
+        return np.sort(rows)
+
+    def query(self, room=None, building=None, instructor=None, course=None, component=None, day=None, when=None,
+              on=None):
+        """
+        Rows matching every given filter. Ex: query(room='H521', day='WE', when=time(18, 30))
+        :return: Sorted array of rows, every row when no filter is given
+        """
+        selections = []
+        if room is not None:
+            selections.append(self.rows('room', room))
+        if building is not None:
+            selections.append(self.by_building(building))
+        if instructor is not None:
+            selections.append(self.by_instructor(instructor))
+        if course is not None:
+            selections.append(self.by_course(course))
+        if component is not None:
+            selections.append(self.rows('component', component))
+        if day is not None or on is not None:
+            selections.append(self.at(day, when, on))
+        elif when is not None:
+            raise ValueError("A time needs the day, the date or both")
+        if not selections:
+            return np.arange(len(self), dtype=np.int32)
+        # Smallest first, each intersection can only shrink
+        selections.sort(key=len)
+        rows = selections[0]
+        for selection in selections[1:]:
+            rows = np.intersect1d(rows, selection, assume_unique=True)
+        return rows
+
+    def students(self, rows):
+        """
+        :return: Sorted list of the distinct students of the rows
+        """
+        return self.values['student'][self.student_codes(rows)].tolist()
+
+    def count_students(self, rows):
+        return len(self.student_codes(rows))
+
+    def student_codes(self, rows):
+        """
+        :return: Sorted array of the distinct student codes of the rows
+        """
+        # A mask over the students instead of np.unique: no sort, and np.unique imports numpy.ma
+        # on its first call, which takes longer than the query itself
+        seen = np.zeros(len(self.values['student']), dtype=bool)
+        seen[self.columns['student'][rows]] = True
+        return np.flatnonzero(seen)
+
+    def record(self, row):
+        """
+        :return: Dict of the values of a row. Ex: {'student': 'jdoe', 'course': 'COMP 249', ...}
+        """
+        record = {name: str(self.values[name][self.columns[name][row]]) for name in STRING_COLUMNS}
+        for name in ('start_date', 'end_date'):
+            value = self.columns[name][row]
+            record[name] = None if np.isnat(value) else value.item()
+        for name in ('start_time', 'end_time'):
+            value = int(self.columns[name][row])
+            record[name] = None if value < 0 else time(value // 60, value % 60)
+        mask = int(self.columns['days'][row])
+        record['days'] = tuple(day for day, bit in DAY_MAPPING.items() if mask & (1 << bit))
+        return record
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and query the columnar store of a cohort.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help="Parse many carts into a store")
+    build.add_argument('source', help="Directory of *_schedule_list_view.html files, or a glob pattern")
+    build.add_argument('-o', '--output', required=True, help="Directory of the store")
+    build.add_argument('-j', '--workers', type=int, default=None, help="Number of processes, one per core by default")
+    build.add_argument('--cache', default=None, help="Directory of the parsed schedule cache, no cache by default")
+
+    query = commands.add_parser('query', help="Students with a class matching every filter")
+    query.add_argument('store', help="Directory of the store")
+    query.add_argument('--room', default=None, help="Ex: H521")
+    query.add_argument('--building', default=None, help="Address, or a short name. Ex: H, EV")
+    query.add_argument('--instructor', default=None)
+    query.add_argument('--course', default=None, help="Ex: COMP 249")
+    query.add_argument('--component', default=None, help="Ex: Lec")
+    query.add_argument('--day', default=None, choices=sorted(DAY_MAPPING, key=DAY_MAPPING.get))
+    query.add_argument('--at', default=None, type=time.fromisoformat, help="Time in session, HH:MM")
+    query.add_argument('--on', default=None, type=date.fromisoformat, help="Date in session, YYYY-MM-DD")
+    query.add_argument('--count', action='store_true', help="Only print the number of students")
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        import BulkParser
+        results = BulkParser.iter_parsed(BulkParser.find_carts(args.source), args.workers,
+                                         cache_directory=args.cache)
+        failed = []
+
+        def parsed():
+            for path, student, courses, error in results:
+                if error is None:
+                    yield student, courses
+                else:
+                    failed.append(path)
+
+        store = CohortStore.build(parsed())
+        store.save(args.output)
+        for path in failed:
+            print(f"Failed to parse {path}", file=sys.stderr)
+        print(f"Wrote {len(store)} classes of {len(store.values['student'])} students to {args.output}")
+        return 1 if failed else 0
+
+    if args.at is not None and args.day is None and args.on is None:
+        parser.error("--at needs --day or --on")
+    store = CohortStore.open(args.store)
+    rows = store.query(args.room, args.building, args.instructor, args.course, args.component, args.day, args.at,
+                       args.on)
+    if args.count:
+        print(store.count_students(rows))
+    else:
+        for student in store.students(rows):
+            print(student)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
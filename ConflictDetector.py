@@ -0,0 +1,159 @@
+import argparse
+import heapq
+import json
+import sys
+
+import BulkParser
+from CourseScheduleParser import DAY_MAPPING
+from EventBuilder import keyed_blocks
+
+"""
+Finds the time blocks of a schedule that overlap.
+
+Every TimeBlock gives one weekly slot per day it meets on, in minutes since Monday 00:00.
+The slots are sorted and swept once, keeping the slots still running in a heap ordered by
+their end, so only slots that really overlap in the week are compared: O(n log n + k) for
+k overlapping pairs. Two overlapping slots conflict on the dates both meet, taken from the
+class meetings expanded by Occurrences, so the days the university is closed can be left out.
+"""
+
+WEEKDAYS = {number: day for day, number in DAY_MAPPING.items()}
+MINUTES_PER_DAY = 24 * 60
+
+
+def weekly_slots(courses):
+    """
+    :param courses: Dict of Course objects
+    :return: List of (start minute of the week, end minute of the week, key, course, event, block), sorted.
+    block is the index of the TimeBlock in keyed_blocks, the same as in Occurrences.expand_courses
+    """
+    slots = []
+    for block, (key, course, event) in enumerate(keyed_blocks(courses)):
+        if event.start_date is None or event.start_time is None:
+            continue
+        start = event.start_time.hour * 60 + event.start_time.minute
+        end = event.end_time.hour * 60 + event.end_time.minute
+        for day in event.days:
+            offset = DAY_MAPPING[day] * MINUTES_PER_DAY
+            slots.append((offset + start, offset + end, key, course, event, block))
+    slots.sort(key=lambda slot: (slot[0], slot[1], slot[2]))
+    return slots
+
+
+def shared_dates(first, second, weekday):
+    """
+    :param first: Sorted datetime64[D] array, the meeting dates of a TimeBlock
+    :param second: Same for the other TimeBlock
+    :param weekday: Day of the week, 0 for Monday
+    :return: datetime64[D] array of the dates both meet on that weekday
+    """
+    import numpy as np
+    import Occurrences
+    dates = np.intersect1d(first, second, assume_unique=True)
+    return dates[Occurrences.weekdays(dates) == weekday]
+
+
+def find_conflicts(courses, closures=None):
+    """
+    :param courses: Dict of Course objects
+    :param closures: Iterable of datetime.date the classes do not meet, ex: a ParseAcademicCalendar.ClosureIndex
+    :return: List of conflicts, ex:
+        {'first': {'course': 'COMP 248', 'key': '1234-S-Lec', 'component': 'Lec'},
+         'second': {...}, 'day': 'MO', 'start': '09:00', 'end': '10:00',
+         'from': '2023-09-11', 'to': '2023-12-04', 'meetings': 13}
+    """
+    # Slots overlapping in the week: (earlier slot, later slot)
+    overlaps = []
+    # (end, sequence, slot) of the slots that started and did not end yet
+    running = []
+    for sequence, slot in enumerate(weekly_slots(courses)):
+        while running and running[0][0] <= slot[0]:
+            heapq.heappop(running)
+        overlaps += [(other, slot) for _, _, other in running]
+        heapq.heappush(running, (slot[1], sequence, slot))
+    if not overlaps:
+        return []
+
+    # Only expanded when needed: most of the time of a cart without any overlap would go there.
+    # Imported here too, so importing Driver does not load NumPy
+    import Occurrences
+    pairs, occurrences = Occurrences.expand_courses(courses, closures)
+    dates = occurrences.dates_by_block(len(pairs))
+    conflicts = []
+    for (_, other_end, other_key, other_course, other_event, other_block), slot in overlaps:
+        start, end, key, course, event, block = slot
+        weekday = start // MINUTES_PER_DAY
+        shared = shared_dates(dates[other_block], dates[block], weekday)
+        if not len(shared):
+            continue
+        overlap_start = start % MINUTES_PER_DAY
+        overlap_end = min(end, other_end) - weekday * MINUTES_PER_DAY
+        conflicts.append({
+            'first': {'course': other_course.title, 'key': other_key, 'component': other_event.component},
+            'second': {'course': course.title, 'key': key, 'component': event.component},
+            'day': WEEKDAYS[weekday],
+            'start': f"{overlap_start // 60:02d}:{overlap_start % 60:02d}",
+            'end': f"{overlap_end // 60:02d}:{overlap_end % 60:02d}",
+            'from': str(shared[0]),
+            'to': str(shared[-1]),
+            'meetings': len(shared),
+        })
+    return conflicts
+
+
+def check_bulk(results):
+    """
+    Checks the schedules of many students.
+    :param results: Iterable of (path, student, courses, error), see BulkParser.iter_parsed
+    :return: Generator of one report per student, ex: {'student': 'jdoe', 'conflicts': [...]}
+        or {'student': 'jdoe', 'error': '...'} when the cart could not be parsed
+    """
+    for path, student, courses, error in results:
+        if error is not None:
+            yield {'student': student, 'file': path, 'error': error}
+        else:
+            yield {'student': student, 'file': path, 'conflicts': find_conflicts(courses)}
+
+
+def print_conflicts(conflicts):
+    for conflict in conflicts:
+        print(f"Conflict on {conflict['day']} {conflict['start']}-{conflict['end']} "
+              f"from {conflict['from']} to {conflict['to']} ({conflict['meetings']} classes): "
+              f"{conflict['first']['course']} {conflict['first']['component']} and "
+              f"{conflict['second']['course']} {conflict['second']['component']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find the overlapping classes of course carts.")
+    parser.add_argument('source', help="A cart file, or with --bulk a directory or glob of cart files")
+    parser.add_argument('--bulk', action='store_true', help="Check many carts, one JSON line per student")
+    parser.add_argument('-o', '--output', default='-', help="With --bulk, output file, - for stdout")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="With --bulk, number of processes")
+    args = parser.parse_args(argv)
+
+    if not args.bulk:
+        _, courses, error = BulkParser.parse_file(args.source)
+        if error is not None:
+            print(f"Failed to parse {args.source}. Error: {error}", file=sys.stderr)
+            return 2
+        conflicts = find_conflicts(courses)
+        print_conflicts(conflicts)
+        return 1 if conflicts else 0
+
+    output = sys.stdout if args.output == '-' else open(args.output, 'w')
+    students = with_conflicts = 0
+    try:
+        results = BulkParser.iter_parsed(BulkParser.find_carts(args.source), args.workers)
+        for report in check_bulk(results):
+            output.write(json.dumps(report) + '\n')
+            students += 1
+            with_conflicts += bool(report.get('conflicts'))
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    print(f"Checked {students} carts, {with_conflicts} with conflicts", file=sys.stderr)
+    return 1 if with_conflicts else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
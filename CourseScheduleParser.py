@@ -1,10 +1,17 @@
-import os
-from datetime import datetime
+from datetime import date, datetime, time
+from html.parser import HTMLParser
 import json
+import logging
 from dateutil.relativedelta import relativedelta
-import hashlib
+import marshal
+import sys
 
-from bs4 import BeautifulSoup
+import Instrumentation
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
 
 LOCATION = {
     "Hall Building": "1455 de Maisonneuve Boulevard West",
@@ -35,6 +42,12 @@ DAY_MAPPING = {
     "SA": 5,
     "SU": 6
 }
+ENROLLMENT_TABLE_ID = 'ACE_STDNT_ENRL_SSV2$0'
+logger = logging.getLogger(__name__)
+# Size of the pieces the cart file is read in by the streaming parser
+CHUNK_SIZE = 64 * 1024
+# Bump when a change to the parser changes its output, it invalidates the ScheduleCache entries
+PARSER_VERSION = 2
 
 """
 New format:
@@ -73,14 +86,26 @@ This module is responsible for parsing the schedule from the course cart.
 class ClassEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, (TimeBlock, Course)):
-            return obj.__dict__
+            return obj.as_dict()
+        if isinstance(obj, (date, time)):
+            return obj.isoformat()
         return super().default(obj)
 
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
 class TimeBlock:
     """
     Represents a single event in a course.
+    Immutable, use replace() to get a changed copy. The strings that repeat across the blocks
+    of a cohort (days, building, instructor, component) are interned, so each is stored once.
     """
 
+    __slots__ = ('start_date', 'end_date', 'start_time', 'end_time', 'days', 'address', 'room', 'instructor',
+                 'class_number', 'section', 'component')
+
     def __init__(self, start_date, end_date, start_time, end_time, days, address, room, instructor, class_number,
                  section, component):
         """
@@ -90,7 +115,7 @@ class TimeBlock:
         :param end_date: Class end date
         :param start_time: Class start time
         :param end_time: Class end time
-        :param days: Days of the week the class is on
+        :param days: Days of the week the class is on, stored as a tuple
         :param address: Building the class is in
         :param room: Room the class is in
         :param instructor: Instructor of the class
@@ -98,18 +123,42 @@ class TimeBlock:
         :param section: Class section
         :param component: What class it is. Ex: LEC
         """
-        self.start_date = start_date
-        self.end_date = end_date
-        self.start_time = start_time
-        self.end_time = end_time
-        self.days = days
-        self.address = address
-        self.room = room
-        self.instructor = instructor
-        self.class_number = class_number
-        self.section = section
-        self.component = component
+        values = (start_date, end_date, start_time, end_time,
+                  tuple(_intern(day) for day in days) if days is not None else None,
+                  _intern(address), room, _intern(instructor), class_number, _intern(section), _intern(component))
+        for name, value in zip(self.__slots__, values):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"TimeBlock is immutable, use replace() to change {name}")
+
+    def __reduce__(self):
+        return TimeBlock, self.values()
+
+    def values(self):
+        """
+        :return: Tuple of the fields, in the order of __slots__
+        """
+        return tuple(getattr(self, name) for name in self.__slots__)
 
+    def replace(self, **changes):
+        """
+        :return: Copy of the block with the given fields changed. Ex: block.replace(room='H521')
+        """
+        fields = dict(zip(self.__slots__, self.values()))
+        fields.update(changes)
+        return TimeBlock(**fields)
+
+    def as_dict(self):
+        return dict(zip(self.__slots__, self.values()))
+
+    def __eq__(self, other):
+        if not isinstance(other, TimeBlock):
+            return NotImplemented
+        return self.values() == other.values()
+
+    def __hash__(self):
+        return hash(self.values())
 
     # to string method
     def __str__(self):
@@ -128,31 +177,48 @@ class TimeBlock:
     def __repr__(self):
         return self.__str__()
 
-    def empty_object_for_json(self):
-        self.start_date = None
-        self.end_date = None
-        self.start_time = None
-        self.end_time = None
-        self.days = None
-        self.address = None
-        self.room = None
-        self.instructor = None
-        self.class_number = None
-        # self.section = None
-        # self.component = None
-
 
 class Course:
     """
     This class represents a single course.
+    Immutable like TimeBlock, its events are a tuple.
     """
 
+    __slots__ = ('title', 'subtitle', 'credits', 'events')
+
     def __init__(self, course_title, course_subtitle, course_credits,
                  events):
-        self.title = course_title
-        self.subtitle = course_subtitle
-        self.credits = course_credits
-        self.events = events
+        object.__setattr__(self, 'title', course_title)
+        object.__setattr__(self, 'subtitle', course_subtitle)
+        object.__setattr__(self, 'credits', course_credits)
+        object.__setattr__(self, 'events', tuple(events))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"Course is immutable, use replace() to change {name}")
+
+    def __reduce__(self):
+        return Course, (self.title, self.subtitle, self.credits, self.events)
+
+    def replace(self, title=None, subtitle=None, credits=None, events=None):
+        """
+        :return: Copy of the course with the given fields changed
+        """
+        return Course(self.title if title is None else title,
+                      self.subtitle if subtitle is None else subtitle,
+                      self.credits if credits is None else credits,
+                      self.events if events is None else events)
+
+    def as_dict(self):
+        return {'title': self.title, 'subtitle': self.subtitle, 'credits': self.credits, 'events': list(self.events)}
+
+    def __eq__(self, other):
+        if not isinstance(other, Course):
+            return NotImplemented
+        return (self.title, self.subtitle, self.credits, self.events) == \
+            (other.title, other.subtitle, other.credits, other.events)
+
+    def __hash__(self):
+        return hash((self.title, self.subtitle, self.credits, self.events))
 
     def __str__(self):
         return f"Course title: {self.title}\n" \
@@ -165,12 +231,90 @@ class BreakLoopException(Exception):
     pass
 
 
-def parse_course_cart(filename, with_modifications=False):
+def parse_course_cart(filename, with_modifications=False, engine='stream', cache=None):
     """
     Goes through the html table, and parses the course cart.
     Each block is one course with all the information.
+    :param engine: 'stream' to read the file with the streaming CartCollector,
+    'soup' to build the full BeautifulSoup tree. Both give the same courses.
+    :param cache: ScheduleCache.ScheduleCache. When the same file was already parsed, the courses
+    are loaded from it and the html is not parsed again.
     :return: List of courses
     """
+    extract = extract_courses_stream if engine == 'stream' else extract_courses_soup
+    with Instrumentation.span('parse.extract', engine=engine, cached=cache is not None):
+        if cache is not None:
+            courses = cache.get_or_parse(filename, extract)
+        else:
+            courses = extract(filename)
+
+    if with_modifications:
+        with Instrumentation.span('parse.modifications'):
+            courses = modifications(courses)
+
+    with Instrumentation.span('parse.shift_start_date'):
+        courses = shift_start_date(courses)
+    Instrumentation.count('parse.courses', len(courses))
+    if logger.isEnabledFor(logging.DEBUG):
+        for course in courses.values():
+            logger.debug("%s\n", course)
+
+    return courses
+
+
+def courses_to_bytes(courses):
+    """
+    Binary form of the courses, for the cache and for passing a cohort between processes.
+    Dates are stored as ordinals and times as seconds since midnight, everything else as is, with marshal.
+    :param courses: Dict of course title -> Course
+    :return: bytes
+    """
+    return marshal.dumps([
+        (course.title, course.subtitle, course.credits, [
+            (_ordinal(event.start_date), _ordinal(event.end_date), _seconds(event.start_time),
+             _seconds(event.end_time)) + event.values()[4:]
+            for event in course.events
+        ])
+        for course in courses.values()
+    ])
+
+
+def courses_from_bytes(data):
+    """
+    Inverse of courses_to_bytes.
+    :return: Dict of course title -> Course
+    """
+    courses = {}
+    for title, subtitle, credits, events in marshal.loads(data):
+        courses[title] = Course(title, subtitle, credits, [
+            TimeBlock(_from_ordinal(start_date), _from_ordinal(end_date), _from_seconds(start_time),
+                      _from_seconds(end_time), *fields)
+            for start_date, end_date, start_time, end_time, *fields in events
+        ])
+    return courses
+
+
+def _ordinal(value):
+    return value.toordinal() if value is not None else None
+
+
+def _from_ordinal(value):
+    return date.fromordinal(value) if value is not None else None
+
+
+def _seconds(value):
+    return value.hour * 3600 + value.minute * 60 + value.second if value is not None else None
+
+
+def _from_seconds(value):
+    return time(value // 3600, value // 60 % 60, value % 60) if value is not None else None
+
+
+def extract_courses_soup(filename):
+    """
+    Builds the BeautifulSoup tree of the whole page and walks it course by course.
+    :return: Dict of course title -> Course
+    """
     courses = {}
     table = extract_table(filename).find('tbody')
 
@@ -181,91 +325,178 @@ def parse_course_cart(filename, with_modifications=False):
     for i, block in enumerate(table.findChildren('tr', recursive=False)):
         count, course = go_thru_each_class(block, count, i)
         courses[course.title] = course
+    return courses
 
-    if with_modifications:
-        modifications(courses)
 
-    courses = shift_start_date(courses)
-    for course in courses.values():
-        print(course)
-        print("\n\n")
+class CartCollector:
+    """
+    Collects the course cart from a stream of tags, no tree is built. It skips everything outside
+    the enrollment table and keeps the text of every MTG_*/DERIVED_* element, indexed by id.
+    Used as the target of the lxml parser, or through CartStreamParser without lxml.
+    """
 
-    return courses
+    def __init__(self):
+        self.table_depth = 0
+        self.done = False
+        # Index of the current course row of the enrollment table
+        self.row = -1
+        self.titles = {}
+        self.fields = {}
+        # Class numbers (the $n of the ids) of each course row, in order
+        self.rows = {}
+        # Open elements whose text is being collected: [tag, key, list of text pieces]
+        self.captures = []
+
+    def start(self, tag, attrs):
+        if self.done:
+            return
+        if tag == 'table':
+            if self.table_depth or attrs.get('id') == ENROLLMENT_TABLE_ID:
+                self.table_depth += 1
+            return
+        if not self.table_depth:
+            return
+        if tag == 'tr' and self.table_depth == 1:
+            self.row += 1
+            self.rows[self.row] = []
+        elif tag == 'h3' and 'ui-bar' in (attrs.get('class') or '').split() and self.row not in self.titles:
+            self.titles[self.row] = ''
+            self.captures.append([tag, ('title', self.row), []])
+        elif (element_id := attrs.get('id')) and element_id.startswith(('MTG_', 'DERIVED_')):
+            self.captures.append([tag, element_id, []])
+            if element_id.startswith('DERIVED_CLS_DTL_CLASS_NBR$'):
+                self.rows[self.row].append(element_id.rsplit('$', 1)[1])
+
+    def end(self, tag):
+        if not self.table_depth:
+            return
+        if self.captures and self.captures[-1][0] == tag:
+            _, key, text = self.captures.pop()
+            text = ''.join(text)
+            if isinstance(key, tuple):
+                self.titles[key[1]] = text
+            else:
+                self.fields[key] = text
+            if self.captures:
+                self.captures[-1][2].append(text)
+        if tag == 'table':
+            self.table_depth -= 1
+            self.done = not self.table_depth
+
+    def data(self, data):
+        if self.captures:
+            self.captures[-1][2].append(data)
+
+    def close(self):
+        return self.courses()
+
+    def courses(self):
+        """
+        :return: Dict of course title -> Course, in the order of the cart
+        """
+        courses = {}
+        for i in sorted(self.titles):
+            class_name, class_subtitle = self.titles[i].split(' - ')
+            units = self.fields[f'DERIVED_REGFRM1_UNT_TAKEN${i}']
+            time_blocks = [build_timeblock(self.fields, n) for n in self.rows[i]]
+            courses[class_name] = Course(class_name, class_subtitle, units, time_blocks)
+        return courses
 
 
-def modifications(courses):
+class CartStreamParser(HTMLParser):
     """
-    Generates a JSON file with the current course structure and mostly null values.
-    Only the component and sections are filled in.
-
-    After creation of the JSON file, it is hashed and compared to the previous hash
-    after user modifications. If the hash is different, the user has modified the file
-    and the program will replace the values in Courses with the values in the JSON file.
+    Feeds a CartCollector with the standard library parser, when lxml is not installed.
     """
-    if os.path.exists('modifications.json') and os.path.exists('modifications_hash.txt'):
-        modifications_hash = hashlib.md5(open('modifications.json', 'rb').read()).hexdigest()
-        with open('modifications_hash.txt', 'r') as f:
-            previous_hash = f.read()
-        if modifications_hash != previous_hash:
-            print("Modifications detected. Replacing values in Courses with values in modifications.json")
-            modify_courses(courses)
-            return None
-            # Continue here
-    # generate a dict to paste later
-    courses_temp = courses.copy()
-    # go through the dict
-    for key in courses_temp:
-        for event in courses_temp[key].events:
-            event.empty_object_for_json()
-    with open('modifications.json', 'w') as f:
-        f.write(json.dumps(courses_temp, indent=4, cls=ClassEncoder))
-    modifications_hash = hashlib.md5(open('modifications.json', 'rb').read()).hexdigest()
-    print(modifications_hash)
-    with open('modifications_hash.txt', 'w') as f:
-        f.write(modifications_hash)
 
+    def __init__(self, collector):
+        super().__init__()
+        self.collector = collector
 
-    print("No modifications detected. Exiting the program. "
-          "User has to modify JSON or have with_modifications=False")
-    exit()
+    def handle_starttag(self, tag, attrs):
+        self.collector.start(tag, dict(attrs))
 
+    def handle_endtag(self, tag):
+        self.collector.end(tag)
 
+    def handle_data(self, data):
+        self.collector.data(data)
 
 
-def modify_courses(courses):
+def extract_courses_stream(filename):
     """
-    Replaces the values in Courses with the values in the JSON file.
-    IMPORTANT: It cannot modify any time values. It can only modify strings.
-    :param courses: Courses object
-    :return:
+    Reads the cart file piece by piece and stops once the enrollment table is over.
+    Uses lxml's parser when it is installed, the standard library one otherwise.
+    :return: Dict of course title -> Course
+    """
+    collector = CartCollector()
+    parser = etree.HTMLParser(target=collector) if etree is not None else CartStreamParser(collector)
+    with open(filename, 'r') as f:
+        while not collector.done and (chunk := f.read(CHUNK_SIZE)):
+            parser.feed(chunk)
+    if etree is None:
+        parser.close()
+    return collector.courses()
+
+
+def build_timeblock(fields, n):
+    """
+    Builds the TimeBlock of the class number $n from the text of the elements, indexed by id.
+    :param fields: Dict of element id -> text. Ex: {'MTG_SCHED$0': 'MoWe 6:30PM - 8:10PM'}
+    :param n: Number at the end of the ids of the class
+    :return: TimeBlock object
+    """
+    days, start_time, end_time = clean_cls_day_time(fields[f"MTG_SCHED${n}"])
+    building, room = clean_cls_room(fields[f"MTG_LOC${n}"])
+    start_date, end_date = clean_cls_dates(fields[f"MTG_DATES${n}"])
+    return TimeBlock(
+        class_number=fields[f"DERIVED_CLS_DTL_CLASS_NBR${n}"],
+        section=fields[f"MTG_SECTION${n}"],
+        days=days,
+        start_time=start_time,
+        end_time=end_time,
+        address=building,
+        room=room,
+        instructor=fields[f"DERIVED_CLS_DTL_SSR_INSTR_LONG${n}"],
+        start_date=start_date,
+        end_date=end_date,
+        # :3 to shorten from Lecture to Lec
+        component=fields[f"MTG_COMP${n}"][:3]
+    )
+
+
+def modifications(courses):
     """
-    with open('modifications.json', 'r') as f:
-        courses_dict = json.loads(f.read())
-    for key, value in courses_dict.items():
-        courses[key].title = value['title']
-        courses[key].subtitle = value['subtitle']
-        courses[key].credits = value['credits']
-        for i, event in enumerate(value['events']):
-            # check for nulls in the event
-            for key2, value2 in event.items():
-                if value2 is not None:
-                    courses[key].events[i].__setattr__(key2, value2)
+    Applies the user overrides of modifications.json to the courses, see ModificationOverlay.
+    The first time, an empty modifications.json is generated to be filled in.
+    :param courses: Dict of Course objects, left unchanged
+    :return: Dict of Course objects with the overrides applied
+    """
+    import ModificationOverlay
+    courses, changed = ModificationOverlay.apply_file(courses)
+    for name in sorted(changed):
+        print(f"Modification changed since the last run: {name}")
+    return courses
 
 
 def shift_start_date(courses):
     """
-    Shifts the start date of each event if the first day in days is not the same as the first day in start_date.
+    Shifts the start date of each event to its first class, the earliest day of days on or after start_date.
     :param courses:
     :return:
     """
     for key, value in courses.items():
+        events = []
         for event in value.events:
-            if event.start_date is not None:
-                if event.start_date.weekday() != event.days[0]:
-                    weekday = DAY_MAPPING[event.days[0]]
-                    event.start_date = event.start_date + relativedelta(weekday=weekday)
+            if event.start_date is not None and event.days:
+                weekdays = [DAY_MAPPING[day] for day in event.days]
+                if event.start_date.weekday() not in weekdays:
+                    event = event.replace(
+                        start_date=min(event.start_date + relativedelta(weekday=weekday) for weekday in weekdays))
+            events.append(event)
+        courses[key] = value.replace(events=events)
     return courses
 
+@Instrumentation.traced('parse.go_thru_each_class')
 def go_thru_each_class(block, count, i):
     """
     Goes through each class in the table of usually 5 classes.
@@ -306,7 +537,7 @@ def go_thru_each_timeblock(count, row):
     """
     cls_number = ""
     if not (cls_number := row.find('span', id=f"DERIVED_CLS_DTL_CLASS_NBR${count}")):
-        print("No class number found")
+        logger.debug("No class number found")
         raise BreakLoopException
 
     cls_number = cls_number.text
@@ -397,11 +628,15 @@ def clean_cls_room(cls_room):
 
 
 def extract_table(filename):
+    # Only the soup engine needs BeautifulSoup, the streaming parser does not import it
+    from bs4 import BeautifulSoup
     html = read_html(filename)
-    soup = BeautifulSoup(html, 'html.parser')
+    with Instrumentation.span('parse.beautifulsoup'):
+        soup = BeautifulSoup(html, 'html.parser')
     return soup.find('table', id='ACE_STDNT_ENRL_SSV2$0')
 
 
+@Instrumentation.traced('parse.read_html')
 def read_html(name):
     with open(name, 'r') as f:
         return f.read()
@@ -1,24 +1,65 @@
 # Driver file to run the program
+import argparse
+import contextlib
+import logging
+import sys
 from datetime import datetime
 
-# TODO: Add a way to modify the calendar according to
-#  the university's academic calendar
-import GcalApiIntegration
+import ConflictDetector
 import CourseScheduleParser
+import Instrumentation
+import ParseAcademicCalendar
+import ScheduleCache
 
 
-def main():
-    delete_or_not()
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Publish the course cart to Google Calendar. "
+                                                 "See ScheduleCli for the version without prompts.")
+    parser.add_argument('--profile', default=None,
+                        help="Write a JSON trace of the stages and API calls to this file, "
+                             "or with a .prof file, a cProfile dump of the parse stage")
+    parser.add_argument('-v', '--verbose', action='store_true', help="Also log every parsed course")
+    parser.add_argument('--offline', action='store_true',
+                        help="Never download the academic calendar, only use its cached pages")
+    parser.add_argument('--closures-fixture', action='append', default=None, metavar='HTML',
+                        help="Saved academic calendar page to read the closed days from. Can be given many times")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format='%(message)s')
+    # A .prof file profiles the parse stage, any other file gets the trace of the whole run
+    profile_parse = args.profile is not None and args.profile.endswith('.prof')
+    if args.profile and not profile_parse:
+        Instrumentation.enable()
+
+    if (status := delete_or_not()) is not None:
+        return status
 
     filename = 'summer_schedule_list_view.html'
     with_modifications = True
-    courses = CourseScheduleParser.parse_course_cart(
-        with_modifications=with_modifications, filename=filename)
-    status = GcalApiIntegration.main(courses)
+    parse_profile = Instrumentation.profile(args.profile) if profile_parse else contextlib.nullcontext()
+    with Instrumentation.span('parse'), parse_profile:
+        courses = CourseScheduleParser.parse_course_cart(
+            with_modifications=with_modifications, filename=filename, cache=ScheduleCache.ScheduleCache())
+    ConflictDetector.print_conflicts(ConflictDetector.find_conflicts(courses))
+    with Instrumentation.span('closures'):
+        closures = ParseAcademicCalendar.load_closures(args.offline, args.closures_fixture)
+    with Instrumentation.span('publish'):
+        # Imports the Google client libraries, only needed from here on
+        import GcalApiIntegration
+        status = GcalApiIntegration.main(courses, closures)
     print(status)
 
+    if (tracer := Instrumentation.tracer()) is not None:
+        tracer.write(args.profile)
+        for name, entry in sorted(tracer.summary().items()):
+            print(f"{name}: {entry['count']} x, {entry['seconds'] * 1000:.1f} ms")
+    return 0
+
 
 def delete_or_not():
+    """
+    Asks what to delete and deletes it.
+    :return: None to go on with the parsing, the exit status once something was deleted or the choice was invalid
+    """
     print("Delete anything? (y/n)")
     delete_choice = input()
     if delete_choice == 'n':
@@ -28,13 +69,16 @@ def delete_or_not():
     date_choice = input()
     if date_choice == 'd':
         date = None
-        delete_from_date(date)
+        return delete_from_date(date)
     elif date_choice == 's':
-        GcalApiIntegration.delete_all_events()
-        exit(0)
+        import GcalApiIntegration
+        service = GcalApiIntegration.get_service()
+        print(GcalApiIntegration.delete_all_events(GcalApiIntegration.CALENDAR_ID, service))
+        return 0
     else:
         print("Invalid choice, exiting...")
-        exit(1)
+        return 1
+
 
 def delete_from_date(date):
     flag = 0
@@ -47,9 +91,11 @@ def delete_from_date(date):
             print("Incorrect date format, should be YYYY-MM-DD")
         else:
             flag = 1
-    GcalApiIntegration.delete_all_events(date)
-    exit(0)
+    import GcalApiIntegration
+    service = GcalApiIntegration.get_service()
+    print(GcalApiIntegration.delete_all_events(GcalApiIntegration.CALENDAR_ID, service, start_date=date))
+    return 0
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -0,0 +1,131 @@
+import datetime
+import hashlib
+import json
+from zoneinfo import ZoneInfo
+
+"""
+Builds the Google Calendar event bodies of the TimeBlocks.
+
+Kept apart from GcalApiIntegration so that offline exports do not need the Google client libraries.
+"""
+
+TIME_ZONE = 'America/Montreal'
+# Private extended property set on every event created by this tool
+TOOL_PROPERTY = 'createdBy'
+TOOL_NAME = 'concordia-schedule'
+# Index of each BYDAY value is its datetime.weekday()
+WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+
+
+def create_event(course, event, closures=None):
+    """
+    Builds the event body of a TimeBlock.
+    :param course: Course object
+    :param event: TimeBlock object
+    :param closures: ParseAcademicCalendar.ClosureIndex. The classes falling on a day the university
+    is closed are excluded from the series with an EXDATE.
+    :return: Dict, event body of the Calendar API
+    """
+    recurrence = [f'RRULE:FREQ=WEEKLY;BYDAY={",".join(event.days)};UNTIL={until(event.end_date)}']
+    if closures is not None and (exdate := closure_exdate(event, closures)):
+        recurrence.append(exdate)
+    event = {
+        'summary': f"{course.title} {event.component} {event.room}",
+        'location': f"{event.address}",
+        'description': f'Course name: {course.subtitle}\n'
+                       f'Credits: {course.credits}\n'
+                       f'Instructor: {event.instructor}\n'
+                       f'Class number: {event.class_number}\n'
+                       f'Component: {event.component}\n'
+                       f'Section: {event.section}',
+
+        'start': {
+            'dateTime': datetime.datetime.combine(event.start_date, event.start_time).isoformat(),
+            'timeZone': TIME_ZONE,
+        },
+        'end': {
+            'dateTime': datetime.datetime.combine(event.start_date, event.end_time).isoformat(),
+            'timeZone': TIME_ZONE,
+        },
+        'recurrence': recurrence,
+        'reminders': {
+            'useDefault': False,
+            'overrides': [
+                {'method': 'popup', 'minutes': 15},
+                {'method': 'popup', 'minutes': 30},
+                {'method': 'popup', 'minutes': 120},
+            ],
+        },
+        'extendedProperties': {
+            'private': {
+                TOOL_PROPERTY: TOOL_NAME,
+                'key': event_key(event),
+            },
+        },
+    }
+    return event
+
+
+def until(end_date):
+    """
+    :param end_date: Last day of the classes, in Montreal
+    :return: UNTIL of the RRULE, the end of that day in UTC, so the class on end_date is kept.
+    Ex: 20231205T045959Z for 2023-12-04
+    """
+    end = datetime.datetime.combine(end_date, datetime.time.max.replace(microsecond=0), ZoneInfo(TIME_ZONE))
+    return end.astimezone(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def closure_exdate(event, closures):
+    """
+    :param event: TimeBlock object
+    :param closures: ParseAcademicCalendar.ClosureIndex
+    :return: EXDATE line with the class meetings on closed days, None if there are none.
+    Ex: EXDATE;TZID=America/Montreal:20231009T183000
+    """
+    weekdays = {WEEKDAYS.index(day) for day in event.days}
+    dates = [day for day in closures.between(event.start_date, event.end_date) if day.weekday() in weekdays]
+    if not dates:
+        return None
+    start_time = event.start_time.strftime('%H%M%S')
+    return f"EXDATE;TZID={TIME_ZONE}:{','.join(f'{day:%Y%m%d}T{start_time}' for day in dates)}"
+
+
+def event_key(event):
+    """
+    Stable identity of a TimeBlock, it does not change when the cart order or the room changes.
+    :param event: TimeBlock object
+    :return: String. Ex: 3103-CCCG-Tut
+    """
+    return f"{event.class_number}-{event.section}-{event.component}"
+
+
+def keyed_blocks(courses):
+    """
+    Pairs every TimeBlock with a unique key. A TimeBlock with the same key as a previous one
+    (ex: a class meeting twice with different times) gets a numbered suffix.
+    :param courses: Dict of Course objects
+    :return: List of (key, Course, TimeBlock)
+    """
+    blocks = []
+    seen = set()
+    for course in courses.values():
+        for event in course.events:
+            key = base = event_key(event)
+            n = 2
+            while key in seen:
+                key = f"{base}-{n}"
+                n += 1
+            seen.add(key)
+            blocks.append((key, course, event))
+    return blocks
+
+
+def event_hash(body):
+    """
+    Hash of the content of an event body, ignoring the extended properties.
+    :param body: Dict returned by create_event
+    :return: String, hex digest
+    """
+    content = {key: value for key, value in body.items() if key != 'extendedProperties'}
+    return hashlib.sha1(json.dumps(content, sort_keys=True).encode()).hexdigest()
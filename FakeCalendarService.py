@@ -0,0 +1,390 @@
+import collections
+import datetime
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from zoneinfo import ZoneInfo
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+"""
+In-memory stand-in for the Google Calendar service returned by build('calendar', 'v3').
+Only implements the calls this project makes, and counts every HTTP round trip
+so that publishing strategies can be compared without a Google account.
+
+The weekly series are expanded like Google does for timeMin/timeMax, singleEvents and
+instances(), so the windowed deletes can run against it too. Latency, quota errors (403/429)
+and server errors (5xx) can be injected to load test the executor, see LoadTest.
+"""
+
+# Google rejects a batch request with more calls
+MAX_BATCH_CALLS = 50
+# Google returns at most this many events per page
+MAX_RESULTS = 2500
+# Series without an UNTIL are expanded this far
+OPEN_SERIES_DAYS = 366
+UTC_FORMAT = '%Y%m%dT%H%M%SZ'
+RRULE_PATTERN = re.compile(r'RRULE:.*?BYDAY=([A-Z,]+)')
+UNTIL_PATTERN = re.compile(r'UNTIL=(\d{8}T\d{6})Z?')
+WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+
+
+class FakeRequest:
+    """
+    Mimics googleapiclient.http.HttpRequest: nothing happens until execute() is called.
+    """
+
+    def __init__(self, service, method, kwargs):
+        self.service = service
+        self.method = method
+        self.kwargs = kwargs
+
+    def execute(self, http=None, num_retries=0):
+        self.service.round_trip()
+        return self.run()
+
+    def run(self):
+        with self.service.lock:
+            self.service.calls += 1
+            self.service.inject_error()
+            return getattr(self.service, f"_{self.method}")(**self.kwargs)
+
+
+class FakeBatch:
+    """
+    Mimics googleapiclient.http.BatchHttpRequest: all added requests go out in one round trip.
+    """
+
+    def __init__(self, service, callback=None):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        if request_id is None:
+            request_id = str(len(self.requests))
+        self.requests.append((request_id, request, callback or self.callback))
+
+    def execute(self, http=None):
+        if len(self.requests) > MAX_BATCH_CALLS:
+            raise http_error(400, 'batchSizeTooLarge')
+        self.service.round_trip()
+        for request_id, request, callback in self.requests:
+            try:
+                response, exception = request.run(), None
+            except Exception as err:
+                response, exception = None, err
+            if callback is not None:
+                callback(request_id, response, exception)
+
+
+class FakeEvents:
+    def __init__(self, service):
+        self.service = service
+
+    def insert(self, **kwargs):
+        return FakeRequest(self.service, 'insert', kwargs)
+
+    def patch(self, **kwargs):
+        return FakeRequest(self.service, 'patch', kwargs)
+
+    def delete(self, **kwargs):
+        return FakeRequest(self.service, 'delete', kwargs)
+
+    def list(self, **kwargs):
+        return FakeRequest(self.service, 'list', kwargs)
+
+    def instances(self, **kwargs):
+        return FakeRequest(self.service, 'instances', kwargs)
+
+
+class FakeCalendarService:
+    """
+    Keeps events per calendar in memory.
+    round_trips counts HTTP requests, calls counts API calls (a batch is one round trip, many calls).
+    """
+
+    def __init__(self, latency=0.0, quota_errors=0, error_rate=0.0, seed=0, jitter=0.0, server_error_rate=0.0,
+                 quota_per_second=None):
+        """
+        :param latency: Seconds every round trip takes
+        :param quota_errors: Number of calls that fail with a 403 rateLimitExceeded before the others go through
+        :param error_rate: Probability of any call failing with a 429
+        :param seed: Seed of the random latency and error injection
+        :param jitter: Up to this many seconds are added at random to the latency of each round trip
+        :param server_error_rate: Probability of any call failing with a 500 or 503
+        :param quota_per_second: Calls allowed in any second, the others fail with a 403 rateLimitExceeded.
+        No limit when None
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.quota_errors = quota_errors
+        self.error_rate = error_rate
+        self.server_error_rate = server_error_rate
+        self.quota_per_second = quota_per_second
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calendars = {}
+        self.round_trips = 0
+        self.calls = 0
+        # Number of failed calls per HTTP status
+        self.errors = collections.Counter()
+        # Times of the calls of the last second, for quota_per_second
+        self._recent = collections.deque()
+        self._ids = itertools.count(1)
+        # Change log used for sync tokens: calendar -> event id -> (sequence number, event or None if deleted)
+        self.changes = {}
+        self._sequence = itertools.count(1)
+        self.last_sequence = 0
+        # Sync tokens older than this are rejected with a 410 Gone, see expire_sync_tokens
+        self.oldest_sync_token = 0
+
+    def round_trip(self):
+        with self.lock:
+            self.round_trips += 1
+            delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            time.sleep(delay)
+
+    def inject_error(self):
+        try:
+            if self.quota_errors > 0:
+                self.quota_errors -= 1
+                raise http_error(403, 'rateLimitExceeded')
+            if self.quota_per_second is not None:
+                now = time.monotonic()
+                while self._recent and now - self._recent[0] >= 1:
+                    self._recent.popleft()
+                if len(self._recent) >= self.quota_per_second:
+                    raise http_error(403, 'rateLimitExceeded')
+                self._recent.append(now)
+            if self.error_rate and self.random.random() < self.error_rate:
+                raise http_error(429, 'rateLimitExceeded')
+            if self.server_error_rate and self.random.random() < self.server_error_rate:
+                raise http_error(self.random.choice((500, 503)), 'backendError')
+        except HttpError as err:
+            self.errors[err.resp.status] += 1
+            raise
+
+    def expire_sync_tokens(self):
+        """
+        Makes every sync token given so far invalid, like Google does after a while.
+        """
+        with self.lock:
+            self.last_sequence = self.oldest_sync_token = next(self._sequence)
+
+    def events(self):
+        return FakeEvents(self)
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self, callback)
+
+    def _event(self, calendarId, eventId):
+        """
+        :return: The event, raises the error Google returns for an unknown or deleted one
+        """
+        if (event := self.calendars.get(calendarId, {}).get(eventId)) is not None:
+            return event
+        if eventId in self.changes.get(calendarId, {}):
+            raise http_error(410, 'deleted')
+        raise http_error(404, 'notFound')
+
+    def _insert(self, calendarId, body):
+        event = dict(body, id=f"event{next(self._ids)}")
+        event['htmlLink'] = f"https://calendar.invalid/{calendarId}/{event['id']}"
+        self.calendars.setdefault(calendarId, {})[event['id']] = event
+        self._record_change(calendarId, event['id'], event)
+        return event
+
+    def _patch(self, calendarId, eventId, body):
+        event = self._event(calendarId, eventId)
+        event.update(body)
+        self._record_change(calendarId, eventId, event)
+        return event
+
+    def _delete(self, calendarId, eventId):
+        base, _, stamp = eventId.rpartition('_')
+        if eventId not in self.calendars.get(calendarId, {}) and base in self.calendars.get(calendarId, {}):
+            # An instance of a series: Google keeps it as a cancelled exception, an EXDATE is the same for a list
+            series = self.calendars[calendarId][base]
+            start = instance_start(series, stamp)
+            if start is None:
+                raise http_error(404, 'notFound')
+            series['recurrence'] = series['recurrence'] + [
+                f"EXDATE;TZID={start.tzinfo.key}:{start:%Y%m%dT%H%M%S}"]
+            self._record_change(calendarId, base, series)
+            return ''
+        self._event(calendarId, eventId)
+        self.calendars[calendarId].pop(eventId)
+        self._record_change(calendarId, eventId, None)
+        return ''
+
+    def _record_change(self, calendarId, eventId, event):
+        self.last_sequence = next(self._sequence)
+        self.changes.setdefault(calendarId, {})[eventId] = (self.last_sequence, event)
+
+    def _list(self, calendarId, privateExtendedProperty=None, pageToken=None, maxResults=250, syncToken=None,
+              timeMin=None, timeMax=None, singleEvents=False, **kwargs):
+        if syncToken:
+            if timeMin or timeMax:
+                raise http_error(400, 'invalid')
+            try:
+                since = int(syncToken)
+            except ValueError:
+                raise http_error(410, 'fullSyncRequired') from None
+            if since < self.oldest_sync_token or since > self.last_sequence:
+                raise http_error(410, 'fullSyncRequired')
+            events = [event if event is not None else {'id': event_id, 'status': 'cancelled'}
+                      for event_id, (sequence, event) in self.changes.get(calendarId, {}).items()
+                      if sequence > since]
+        else:
+            events = list(self.calendars.get(calendarId, {}).values())
+        if privateExtendedProperty:
+            name, value = privateExtendedProperty.split('=', 1)
+            events = [event for event in events
+                      if event.get('extendedProperties', {}).get('private', {}).get(name) == value]
+        if timeMin or timeMax or singleEvents:
+            time_min = parse_time(timeMin) if timeMin else None
+            time_max = parse_time(timeMax) if timeMax else None
+            windowed = []
+            for event in events:
+                if event.get('status') == 'cancelled':
+                    windowed.append(event)
+                elif singleEvents:
+                    windowed += expand_instances(event, time_min, time_max)
+                elif any(True for _ in occurrences(event, time_min, time_max)):
+                    windowed.append(event)
+            events = windowed
+        return page(events, pageToken, maxResults, nextSyncToken=str(self.last_sequence))
+
+    def _instances(self, calendarId, eventId, timeMin=None, timeMax=None, pageToken=None, maxResults=250,
+                   **kwargs):
+        event = self._event(calendarId, eventId)
+        instances = expand_instances(event, parse_time(timeMin) if timeMin else None,
+                                     parse_time(timeMax) if timeMax else None)
+        return page(instances, pageToken, maxResults)
+
+
+def page(items, page_token, max_results, **last):
+    """
+    :param last: Fields only set on the last page. Ex: nextSyncToken
+    :return: Response of a list call, the page of items starting at page_token
+    """
+    max_results = min(max_results or 250, MAX_RESULTS)
+    start = int(page_token or 0)
+    response = {'items': items[start:start + max_results]}
+    if start + max_results < len(items):
+        response['nextPageToken'] = str(start + max_results)
+    else:
+        response.update(last)
+    return response
+
+
+def parse_time(value, time_zone=None):
+    """
+    :param value: ISO date or datetime. Ex: 2023-10-08T00:00:00-04:00
+    :param time_zone: Zone of a naive value, UTC when None
+    :return: Aware datetime.datetime
+    """
+    value = datetime.datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=ZoneInfo(time_zone) if time_zone else datetime.timezone.utc)
+    return value
+
+
+def event_time(time_field):
+    """
+    :param time_field: start or end of an event. Ex: {'dateTime': '2023-09-05T13:15:00', 'timeZone': 'America/Montreal'}
+    :return: Aware datetime.datetime, in the zone of the event
+    """
+    zone = ZoneInfo(time_field.get('timeZone', 'UTC'))
+    value = datetime.datetime.fromisoformat(time_field.get('dateTime', time_field.get('date')))
+    if value.tzinfo is None:
+        return value.replace(tzinfo=zone)
+    return value.astimezone(zone)
+
+
+def occurrences(event, time_min=None, time_max=None):
+    """
+    Expands a weekly series, the only kind this tool creates, without its EXDATEs.
+    :param event: Event dict
+    :param time_min: Aware datetime, only the occurrences ending after it
+    :param time_max: Aware datetime, only the occurrences starting before it
+    :return: Generator of (start, end) aware datetimes
+    """
+    start, end = event_time(event['start']), event_time(event['end'])
+    duration = end - start
+    rules = event.get('recurrence', [])
+    rrule = next((rule for rule in rules if rule.startswith('RRULE')), None)
+    if rrule is None:
+        if (time_min is None or end > time_min) and (time_max is None or start < time_max):
+            yield start, end
+        return
+
+    days = {WEEKDAYS.index(day) for day in RRULE_PATTERN.search(rrule).group(1).split(',')}
+    if until := UNTIL_PATTERN.search(rrule):
+        until = datetime.datetime.strptime(until.group(1), '%Y%m%dT%H%M%S').replace(tzinfo=datetime.timezone.utc)
+    else:
+        until = start + datetime.timedelta(days=OPEN_SERIES_DAYS)
+    excluded = set()
+    for rule in rules:
+        if rule.startswith('EXDATE'):
+            header, values = rule.split(':', 1)
+            zone = header.split('TZID=')[1] if 'TZID=' in header else None
+            excluded.update(parse_time(value.rstrip('Z'), zone) for value in values.split(','))
+
+    day = start
+    while day <= until and (time_max is None or day < time_max):
+        if day.weekday() in days and day not in excluded and (time_min is None or day + duration > time_min):
+            yield day, day + duration
+        # Same wall clock time the next day, across the DST changes
+        day = (day.replace(tzinfo=None) + datetime.timedelta(days=1)).replace(tzinfo=start.tzinfo)
+
+
+def instance_start(event, stamp):
+    """
+    :param stamp: UTC start of an instance, as in its id. Ex: 20230905T171500Z
+    :return: Start of the occurrence of the series at that time, None if there is none
+    """
+    try:
+        start = datetime.datetime.strptime(stamp, UTC_FORMAT).replace(tzinfo=datetime.timezone.utc)
+    except ValueError:
+        return None
+    for occurrence, _ in occurrences(event, start, start + datetime.timedelta(seconds=1)):
+        if occurrence == start:
+            return occurrence
+    return None
+
+
+def expand_instances(event, time_min=None, time_max=None):
+    """
+    :return: List of the instances of the event in the window, as Google returns them with singleEvents.
+    An event that is not recurring is its own instance.
+    """
+    if not any(rule.startswith('RRULE') for rule in event.get('recurrence', [])):
+        return [event] if any(True for _ in occurrences(event, time_min, time_max)) else []
+    instances = []
+    for start, end in occurrences(event, time_min, time_max):
+        stamp = start.astimezone(datetime.timezone.utc).strftime(UTC_FORMAT)
+        instance = {key: value for key, value in event.items() if key not in ('recurrence', 'id')}
+        instance.update(
+            id=f"{event['id']}_{stamp}",
+            recurringEventId=event['id'],
+            originalStartTime={'dateTime': start.isoformat(), 'timeZone': event['start'].get('timeZone')},
+            start={'dateTime': start.isoformat(), 'timeZone': event['start'].get('timeZone')},
+            end={'dateTime': end.isoformat(), 'timeZone': event['end'].get('timeZone')},
+        )
+        instances.append(instance)
+    return instances
+
+
+def http_error(status, reason):
+    """
+    Builds the HttpError the real client raises for a status and an error reason.
+    """
+    content = json.dumps({'error': {'code': status, 'errors': [{'reason': reason}], 'message': reason}})
+    return HttpError(httplib2.Response({'status': status}), content.encode())
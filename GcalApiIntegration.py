@@ -1,27 +1,76 @@
 import datetime
+import hashlib
+import logging
 import os.path
 
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
+import CalendarExecutor
+import Instrumentation
+from EventBuilder import create_event, event_hash, keyed_blocks
 
+"""
+The Google client libraries are imported by the functions that call the API, so parsing and
+exporting never pay for them. The credentials and the service are built once per process.
+"""
 
 SCOPES = ['https://www.googleapis.com/auth/calendar']
+# Google Calendar accepts at most 50 calls in one batch request
+MAX_BATCH_SIZE = 50
+CALENDAR_ID = "55776be14ae7a96ee99b52690ac75ade9a0db90653d3f77b128c49e79edb3bad@group.calendar.google.com"
 
-def main(courses):
-    # TODO: Clean up this function
-    calendarId = "55776be14ae7a96ee99b52690ac75ade9a0db90653d3f77b128c49e79edb3bad@group.calendar.google.com"
+logger = logging.getLogger(__name__)
 
+_creds = None
+# (credentials, service) of the last get_service call
+_service = None
+
+
+def main(courses, closures=None, calendarId=CALENDAR_ID):
     creds = create_creds(calendarId)
-    service = build('calendar', 'v3', credentials=creds)
+    service = get_service(calendarId)
+    executor = CalendarExecutor.RequestExecutor(http_factory=lambda: authorized_http(creds))
 
     # delete_all_events(calendarId, service)
-    return populate_events(calendarId, courses, creds, service)
+    report = publish(calendarId, courses, service, executor=executor, closures=closures)
+    print(f"API calls: {executor.metrics.summary()}")
+    if report['errors']:
+        return f"Sync finished with errors: {report}"
+    return f"Success: {report}"
+
+
+def publish(calendarId, courses, service, executor=None, closures=None, keys=None):
+    """
+    Makes the calendar match the courses, only sending what changed since the last run.
+    The snapshot and the journal of the calendar are kept on disk, see state_path.
+    :param keys: Only sync the TimeBlocks with these keys, see CalendarSync.sync_events
+    :return: Dict with the number of inserted, patched, deleted and unchanged events and the errors,
+    see CalendarSync.sync_events
+    """
+    import CalendarSnapshot
+    import CalendarSync
+    import SyncJournal
+    snapshot = CalendarSnapshot.CalendarSnapshot(calendarId, state_path('calendar_snapshot.json', calendarId))
+    with Instrumentation.span('calendar.snapshot'):
+        snapshot.refresh(service, executor=executor)
+    journal_path = state_path('sync_journal.jsonl', calendarId)
+    with Instrumentation.span('calendar.sync'), SyncJournal.SyncJournal(calendarId, journal_path) as journal:
+        return CalendarSync.sync_events(calendarId, courses, service, existing=snapshot.tool_events(),
+                                        executor=executor, journal=journal, closures=closures, keys=keys)
+
+
+def state_path(name, calendarId):
+    """
+    :param name: File of the default calendar. Ex: calendar_snapshot.json
+    :return: name for CALENDAR_ID, name with a hash of the calendar id for the others.
+    Ex: calendar_snapshot-1a2b3c4d5e6f.json
+    """
+    if calendarId == CALENDAR_ID:
+        return name
+    base, extension = os.path.splitext(name)
+    return f"{base}-{hashlib.sha1(calendarId.encode()).hexdigest()[:12]}{extension}"
 
 
 def populate_events(calendarId, courses, creds, service):
+    from googleapiclient.errors import HttpError
     try:
 
         # Create a list of events, one event per course
@@ -31,8 +80,8 @@ def populate_events(calendarId, courses, creds, service):
             for event in course.events:
                 # create a new event
                 event = create_event(course, event)
-                event = service.events().insert(calendarId=calendarId, body=event).execute()
-                print(f'Event created: {event.get("htmlLink")}')
+                event = run_request(service.events().insert(calendarId=calendarId, body=event))
+                logger.info('Event created: %s', event.get("htmlLink"))
 
     except HttpError as err:
         return f"Failed to create event. Error: {err}"
@@ -41,10 +90,142 @@ def populate_events(calendarId, courses, creds, service):
     return "Success"
 
 
+def populate_events_batched(calendarId, courses, service, batch_size=MAX_BATCH_SIZE, executor=None, journal=None,
+                            closures=None):
+    """
+    Same as populate_events, but the inserts are sent in batch requests of up to batch_size events.
+    A failed insert does not stop the others.
+    :param calendarId: Calendar to insert the events into
+    :param courses: Dict of Course objects
+    :param service: Calendar service
+    :param batch_size: Number of inserts per batch request
+    :param executor: CalendarExecutor.RequestExecutor used to send the batches, see run_requests
+    :param journal: SyncJournal.SyncJournal of the calendar. The TimeBlocks it already holds are skipped,
+    and every created event is written to it after each batch, so a failed run can be resumed.
+    :param closures: ParseAcademicCalendar.ClosureIndex of the days the classes are cancelled
+    :return: List of dicts with the key, the course, the TimeBlock, the created event (or None)
+    and the error (or None)
+    """
+    blocks = keyed_blocks(courses)
+    if journal is not None:
+        blocks = [(key, course, event) for key, course, event in blocks if journal.event_id(key) is None]
+
+    results = []
+    # Without a journal everything goes in one call so the executor can run the batches concurrently
+    step = batch_size if journal is not None else max(len(blocks), 1)
+    for start in range(0, len(blocks), step):
+        chunk = blocks[start:start + step]
+        bodies = []
+        for key, course, event in chunk:
+            body = create_event(course, event, closures)
+            body['extendedProperties']['private'].update(key=key, hash=event_hash(body))
+            bodies.append(body)
+        requests = [service.events().insert(calendarId=calendarId, body=body) for body in bodies]
+
+        for (key, course, event), body, (response, error) in zip(
+                chunk, bodies, run_requests(service, requests, batch_size, executor)):
+            if error is None:
+                logger.info('Event created: %s', response.get("htmlLink"))
+                if journal is not None:
+                    journal.record(key, response['id'], body['extendedProperties']['private']['hash'])
+            else:
+                logger.error('Failed to create event for %s %s. Error: %s', course.title, event.component, error)
+            results.append({'key': key, 'course': course, 'event': event, 'response': response, 'error': error})
+        if journal is not None:
+            journal.flush()
+    return results
+
+
+def run_requests(service, requests, batch_size=MAX_BATCH_SIZE, executor=None):
+    """
+    Sends the requests in batches. With an executor, the batches go out concurrently, rate limited,
+    and the calls failing with a transient error are retried.
+    :return: List of (response, error) tuples in the same order as requests
+    """
+    if executor is None:
+        return execute_batched(service, requests, batch_size)
+    return executor.run_batched(service, requests, min(batch_size, MAX_BATCH_SIZE))
+
+
+def run_request(request, executor=None):
+    """
+    Executes a single request, through the executor when there is one.
+    :return: The response of the request
+    """
+    if executor is None:
+        Instrumentation.count('api.calls')
+        with Instrumentation.span('api.call'):
+            return request.execute()
+    return executor.execute(request)
+
+
+def execute_batched(service, requests, batch_size=MAX_BATCH_SIZE):
+    """
+    Sends the requests in batch requests of up to batch_size calls, one round trip per batch.
+    :param service: Calendar service
+    :param requests: List of HttpRequest objects, ex: service.events().insert(...)
+    :param batch_size: Number of calls per batch request
+    :return: List of (response, error) tuples in the same order as requests
+    """
+    from googleapiclient.errors import HttpError
+    batch_size = min(batch_size, MAX_BATCH_SIZE)
+    results = [(None, None)] * len(requests)
+
+    def callback(request_id, response, exception):
+        results[int(request_id)] = (response, exception)
+
+    for start in range(0, len(requests), batch_size):
+        batch = service.new_batch_http_request(callback=callback)
+        for i, request in enumerate(requests[start:start + batch_size], start):
+            batch.add(request, request_id=str(i))
+        try:
+            Instrumentation.count('api.calls', min(batch_size, len(requests) - start))
+            with Instrumentation.span('api.batch', size=min(batch_size, len(requests) - start)):
+                batch.execute()
+        except HttpError as err:
+            # The whole batch was rejected, none of its calls went through
+            for i in range(start, min(start + batch_size, len(requests))):
+                results[i] = (None, err)
+    return results
+
+
+def get_service(calendarId=CALENDAR_ID):
+    """
+    :return: Calendar service, built once per process. The discovery document is the one shipped
+    with googleapiclient (static_discovery), so building it never downloads anything.
+    """
+    global _service
+    creds = create_creds(calendarId)
+    if _service is None or _service[0] is not creds:
+        from googleapiclient.discovery import build
+        with Instrumentation.span('google.build'):
+            _service = creds, build('calendar', 'v3', credentials=creds, static_discovery=True)
+    return _service[1]
+
+
+def authorized_http(creds):
+    """
+    New authorized http object. httplib2 is not thread safe, so each worker thread needs its own.
+    """
+    import google_auth_httplib2
+    import httplib2
+    return google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http())
+
+
+@Instrumentation.traced('google.create_creds')
 def create_creds(calendarId):
-    creds = None
+    """
+    :return: Credentials, loaded from token.json once per process and refreshed when they expire
+    """
+    global _creds
+    if _creds is not None and _creds.valid:
+        return _creds
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    creds = _creds
 
-    if os.path.exists('token.json'):
+    if creds is None and os.path.exists('token.json'):
         creds = Credentials.from_authorized_user_file('token.json', SCOPES)
     # If there are no (valid) credentials available, let the user log in.
     if not creds or not creds.valid:
@@ -57,65 +238,53 @@ def create_creds(calendarId):
         # Save the credentials for the next run
         with open('token.json', 'w') as token:
             token.write(creds.to_json())
+    _creds = creds
     return creds
 
 
-def create_event(course, event):
-    event = {
-        'summary': f"{course.title} {event.component} {event.room}",
-        'location': f"{event.address}",
-        'description': f'Course name: {course.subtitle}\n'
-                       f'Credits: {course.credits}\n'
-                       f'Instructor: {event.instructor}\n'
-                       f'Class number: {event.class_number}\n'
-                       f'Component: {event.component}\n'
-                       f'Section: {event.section}',
-
-        'start': {
-            'dateTime': datetime.datetime.combine(event.start_date, event.start_time).isoformat(),
-            'timeZone': 'America/Montreal',
-        },
-        'end': {
-            'dateTime': datetime.datetime.combine(event.start_date, event.end_time).isoformat(),
-            'timeZone': 'America/Montreal',
-        },
-        'recurrence': [
-            f'RRULE:FREQ=WEEKLY;BYDAY={",".join(event.days)};UNTIL={event.end_date.strftime("%Y%m%dT%H%M%SZ")}'
-        ],
-        'reminders': {
-            'useDefault': False,
-            'overrides': [
-                {'method': 'popup', 'minutes': 15},
-                {'method': 'popup', 'minutes': 30},
-                {'method': 'popup', 'minutes': 120},
-            ],
-        },
-    }
-    return event
-
-
-def delete_all_events(calendarId, service, start_date=None, specific_date=None):
-    event_results = service.events().list(calendarId=calendarId, singleEvents=True).execute()
-    if events := event_results.get('items', []):
-        for event in events:
-            if (
-                start_date
-                and event['start']['dateTime'] > start_date
-                and not specific_date
-            ):
-                event_id = event['id']
-                delete_one_event(calendarId, event_id, service)
-            elif (
-                specific_date
-                and event['start']['dateTime'] == specific_date
-            ):
-                event_id = event['id']
-                delete_one_event(calendarId, event_id, service)
+def delete_all_events(calendarId, service, start_date=None, specific_date=None, snapshot=None, executor=None,
+                      end_date=None):
+    """
+    Deletes the events created by this tool, series by series.
+    :param start_date: Only delete the occurrences from this date on. Ex: 2023-10-08
+    :param specific_date: Only delete the occurrences on this day. Ex: 2023-10-08
+    :param end_date: Only delete the occurrences before this date. Ex: 2023-12-01
+    :param snapshot: Up to date CalendarSnapshot of the calendar, read instead of listing the calendar again
+    when there is no date filter. The snapshot file of the calendar is refreshed and read when None, see state_path.
+    :param executor: CalendarExecutor.RequestExecutor used for the calls
+    :return: Dict with the number of deleted series, truncated series, deleted instances and the errors
+    """
+    import CalendarDeletion
+    import CalendarSnapshot
+    import SyncJournal
+    time_min = time_max = None
+    if specific_date:
+        time_min = datetime.date.fromisoformat(str(specific_date)[:10])
+        time_max = time_min + datetime.timedelta(days=1)
     else:
+        if start_date:
+            time_min = datetime.date.fromisoformat(str(start_date)[:10])
+        if end_date:
+            time_max = datetime.date.fromisoformat(str(end_date)[:10])
+    existing = None
+    if time_min is None and time_max is None:
+        if snapshot is None:
+            snapshot = CalendarSnapshot.CalendarSnapshot(calendarId, state_path('calendar_snapshot.json', calendarId))
+            with Instrumentation.span('calendar.snapshot'):
+                snapshot.refresh(service, executor=executor)
+        existing = snapshot.tool_events()
+
+    # The deleted series leave the journal, so a resumed populate_events_batched inserts them again
+    with SyncJournal.SyncJournal(calendarId, state_path('sync_journal.jsonl', calendarId)) as journal:
+        report = CalendarDeletion.delete_events(calendarId, service, time_min, time_max, existing=existing,
+                                                executor=executor, journal=journal)
+    if not any(report[key] for key in ('deleted_series', 'truncated_series', 'deleted_instances')):
         print('No upcoming events found.')
+    return report
 
 
 def delete_one_event(calendarId, event_id, service):
+    from googleapiclient.errors import HttpError
     try:
         service.events().delete(calendarId=calendarId, eventId=event_id).execute()
     except HttpError as err:
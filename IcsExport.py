@@ -0,0 +1,222 @@
+import argparse
+import datetime
+import os
+import sys
+
+import CourseScheduleParser
+from EventBuilder import TIME_ZONE, TOOL_NAME, create_event, keyed_blocks
+
+"""
+Offline export of the courses to an iCalendar (.ics) file, RFC 5545.
+
+Uses the same event bodies as GcalApiIntegration.create_event and writes one VEVENT at a time,
+so a whole term (or a whole cohort) can be imported in any calendar client from a single file
+without any API call.
+"""
+
+# America/Montreal since 2007: EST/EDT, DST from the second Sunday of March to the first Sunday of November
+VTIMEZONE = [
+    'BEGIN:VTIMEZONE',
+    f'TZID:{TIME_ZONE}',
+    'BEGIN:DAYLIGHT',
+    'TZOFFSETFROM:-0500',
+    'TZOFFSETTO:-0400',
+    'TZNAME:EDT',
+    'DTSTART:20070311T020000',
+    'RRULE:FREQ=YEARLY;BYMONTH=3;BYDAY=2SU',
+    'END:DAYLIGHT',
+    'BEGIN:STANDARD',
+    'TZOFFSETFROM:-0400',
+    'TZOFFSETTO:-0500',
+    'TZNAME:EST',
+    'DTSTART:20071104T020000',
+    'RRULE:FREQ=YEARLY;BYMONTH=11;BYDAY=1SU',
+    'END:STANDARD',
+    'END:VTIMEZONE',
+]
+
+
+def escape_text(text):
+    """
+    Escapes a TEXT value. Ex: "a, b\\nc" -> "a\\, b\\\\nc"
+    """
+    return text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def fold(line):
+    """
+    Splits a content line into pieces of at most 75 octets, the continuation lines start with a space.
+    """
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    pieces = []
+    start = 0
+    limit = 75
+    while start < len(encoded):
+        end = min(start + limit, len(encoded))
+        # Never cut a multi-byte character in two
+        while end < len(encoded) and (encoded[end] & 0xC0) == 0x80:
+            end -= 1
+        pieces.append(encoded[start:end].decode('utf-8'))
+        start = end
+        limit = 74
+    return '\r\n '.join(pieces) + '\r\n'
+
+
+def local_datetime(value):
+    """
+    :param value: ISO datetime of an event body. Ex: 2023-07-03T18:30:00
+    :return: iCalendar local datetime. Ex: 20230703T183000
+    """
+    return datetime.datetime.fromisoformat(value).strftime('%Y%m%dT%H%M%S')
+
+
+def vevent_lines(body, uid, stamp):
+    """
+    :param body: Event body from create_event
+    :param uid: Unique id of the event
+    :param stamp: DTSTAMP value, UTC. Ex: 20230703T183000Z
+    :return: List of content lines of the VEVENT
+    """
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:{uid}',
+        f'DTSTAMP:{stamp}',
+        f"DTSTART;TZID={body['start']['timeZone']}:{local_datetime(body['start']['dateTime'])}",
+        f"DTEND;TZID={body['end']['timeZone']}:{local_datetime(body['end']['dateTime'])}",
+        f"SUMMARY:{escape_text(body['summary'])}",
+        f"LOCATION:{escape_text(body['location'])}",
+        f"DESCRIPTION:{escape_text(body['description'])}",
+    ]
+    lines += body.get('recurrence', [])
+    for reminder in body['reminders']['overrides']:
+        lines += [
+            'BEGIN:VALARM',
+            'ACTION:DISPLAY',
+            f"DESCRIPTION:{escape_text(body['summary'])}",
+            f"TRIGGER:-PT{reminder['minutes']}M",
+            'END:VALARM',
+        ]
+    lines.append('END:VEVENT')
+    return lines
+
+
+class IcsWriter:
+    """
+    Writes a VCALENDAR to an open text file, one event at a time.
+    """
+
+    def __init__(self, output, name=None):
+        self.output = output
+        self.stamp = datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        self.events = 0
+        lines = ['BEGIN:VCALENDAR', 'VERSION:2.0', f'PRODID:-//{TOOL_NAME}//EN', 'CALSCALE:GREGORIAN']
+        if name:
+            lines.append(f'X-WR-CALNAME:{escape_text(name)}')
+        self._write(lines + VTIMEZONE)
+
+    def _write(self, lines):
+        self.output.write(''.join(fold(line) for line in lines))
+
+    def add_courses(self, courses, uid_prefix='', closures=None):
+        """
+        :param courses: Dict of Course objects
+        :param uid_prefix: Prefix of the event UIDs, keeps them unique when many students share a file
+        :param closures: ParseAcademicCalendar.ClosureIndex of the days the classes are cancelled
+        """
+        for key, course, event in keyed_blocks(courses):
+            body = create_event(course, event, closures)
+            self._write(vevent_lines(body, f"{uid_prefix}{key}@{TOOL_NAME}", self.stamp))
+            self.events += 1
+
+    def close(self):
+        self._write(['END:VCALENDAR'])
+
+
+def export_courses(courses, path, name=None, closures=None):
+    """
+    Writes the courses of one student to an .ics file.
+    :param closures: ParseAcademicCalendar.ClosureIndex of the days the classes are cancelled
+    :return: Number of events written
+    """
+    with open(path, 'w', newline='') as f:
+        writer = IcsWriter(f, name)
+        writer.add_courses(courses, closures=closures)
+        writer.close()
+    return writer.events
+
+
+def export_bulk(results, directory=None, combined=None, closures=None):
+    """
+    Writes the courses of many students, either one .ics file per student in directory,
+    or all of them in the single combined file, or both.
+    :param results: Iterable of (path, student, courses, error), see BulkParser.iter_parsed
+    :param directory: Directory of the per-student files
+    :param combined: Path of the combined file
+    :param closures: ParseAcademicCalendar.ClosureIndex of the days the classes are cancelled
+    :return: (number of events per student written, list of (student, error) of the carts that could not be parsed)
+    """
+    events = 0
+    errors = []
+    combined_file = open(combined, 'w', newline='') if combined else None
+    try:
+        combined_writer = IcsWriter(combined_file, 'Course schedules') if combined_file else None
+        for _, student, courses, error in results:
+            if error is not None:
+                errors.append((student, error))
+                continue
+            if directory:
+                export_courses(courses, os.path.join(directory, f"{student}.ics"), student, closures)
+            if combined_writer:
+                combined_writer.add_courses(courses, uid_prefix=f"{student}-", closures=closures)
+            events += sum(len(course.events) for course in courses.values())
+        if combined_writer:
+            combined_writer.close()
+    finally:
+        if combined_file:
+            combined_file.close()
+    return events, errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export course carts to iCalendar files, without the Google API.")
+    parser.add_argument('source', help="A cart file, or with --bulk a directory or glob of cart files")
+    parser.add_argument('-o', '--output', help="Output .ics file (single cart, or the combined feed with --bulk)")
+    parser.add_argument('--bulk', action='store_true', help="Export many carts, see BulkParser")
+    parser.add_argument('--out-dir', help="With --bulk, directory for one .ics file per student")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="With --bulk, number of processes")
+    parser.add_argument('--closures', action='store_true',
+                        help="Exclude the days the university is closed (downloads the academic calendar)")
+    parser.add_argument('--offline', action='store_true',
+                        help="With --closures, only use the cached academic calendar, never download it")
+    parser.add_argument('--closures-fixture', action='append', default=None, metavar='HTML',
+                        help="Saved academic calendar page to read the closed days from, implies --closures. "
+                             "Can be given many times")
+    args = parser.parse_args(argv)
+
+    closures = None
+    if args.closures or args.closures_fixture:
+        import ParseAcademicCalendar
+        closures = ParseAcademicCalendar.load_closures(args.offline, args.closures_fixture)
+
+    if not args.bulk:
+        courses = CourseScheduleParser.extract_courses_stream(args.source)
+        courses = CourseScheduleParser.shift_start_date(courses)
+        output = args.output or f"{os.path.splitext(args.source)[0]}.ics"
+        print(f"Wrote {export_courses(courses, output, closures=closures)} events to {output}")
+        return 0
+
+    import BulkParser
+    if args.out_dir:
+        os.makedirs(args.out_dir, exist_ok=True)
+    results = BulkParser.iter_parsed(BulkParser.find_carts(args.source), args.workers)
+    events, errors = export_bulk(results, args.out_dir, args.output, closures)
+    for student, error in errors:
+        print(f"Failed to parse the cart of {student}. Error: {error}", file=sys.stderr)
+    print(f"Wrote {events} events")
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
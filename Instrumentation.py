@@ -0,0 +1,143 @@
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+"""
+Timing of the stages of a run and of every API call.
+
+Nothing is recorded until enable() is called: span() and count() then only check a global.
+Once enabled, every span is kept with its start and duration, and write() saves them as a
+Chrome trace (open it in chrome://tracing or https://ui.perfetto.dev) with the counters and
+the total time of each stage.
+"""
+
+_tracer = None
+
+
+class Tracer:
+    """
+    Spans and counters of one run, shared by all the threads.
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.spans = []
+        self.counters = Counter()
+        self.lock = threading.Lock()
+
+    def add(self, name, start, duration, attrs):
+        with self.lock:
+            self.spans.append((name, start - self.origin, duration, threading.get_ident(), attrs))
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+
+    def summary(self):
+        """
+        :return: Dict of span name -> {'count', 'seconds'}, the calls and total time of each stage
+        """
+        summary = {}
+        with self.lock:
+            for name, _, duration, _, _ in self.spans:
+                entry = summary.setdefault(name, {'count': 0, 'seconds': 0.0})
+                entry['count'] += 1
+                entry['seconds'] += duration
+        return summary
+
+    def write(self, path):
+        """
+        Writes the spans in the Chrome trace event format, with the counters and the summary.
+        """
+        pid = os.getpid()
+        with self.lock:
+            events = [
+                {'name': name, 'ph': 'X', 'ts': start * 1e6, 'dur': duration * 1e6, 'pid': pid, 'tid': tid,
+                 'args': attrs}
+                for name, start, duration, tid, attrs in self.spans
+            ]
+            counters = dict(self.counters)
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'counters': counters, 'summary': self.summary()}, f)
+
+
+def enable():
+    """
+    Starts recording, replacing what was recorded before.
+    :return: Tracer
+    """
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+
+def disable():
+    global _tracer
+    _tracer = None
+
+
+def tracer():
+    """
+    :return: The current Tracer, None when disabled
+    """
+    return _tracer
+
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Times the block. Ex: with span('parse.extract', engine='stream'): ...
+    """
+    if _tracer is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _tracer.add(name, start, time.perf_counter() - start, attrs)
+
+
+def traced(name):
+    """
+    Decorator timing every call of the function as a span.
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                _tracer.add(name, start, time.perf_counter() - start, {})
+
+        return wrapper
+
+    return decorator
+
+
+def count(name, n=1):
+    if _tracer is not None:
+        _tracer.count(name, n)
+
+
+@contextmanager
+def profile(path):
+    """
+    Runs the block under cProfile and dumps the stats to path, read them with pstats or snakeviz.
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
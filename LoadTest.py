@@ -0,0 +1,194 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import timedelta
+
+import CalendarExecutor
+import CourseScheduleParser
+import GcalApiIntegration
+import Instrumentation
+import SyntheticCart
+from FakeCalendarService import FakeCalendarService
+
+"""
+Load test of publishing and deleting against FakeCalendarService, no Google account needed.
+Run with: python LoadTest.py [-n 50] [--latency 0.02] [--quota 100] [--json results.json]
+
+A synthetic cart goes through populate_events (one call at a time, no retries), then through
+populate_events_batched on the RequestExecutor, then is deleted with delete_all_events, first a
+week in the middle of the term, then everything. The fake service adds latency and fails calls
+with quota errors and 5xx as configured. For each stage the report gives the throughput, the
+latency percentiles of the HTTP calls (from the api.call spans) and the errors Google sent.
+"""
+
+CALENDAR = 'load-test'
+
+
+def synthetic_courses(n_courses, seed=0):
+    """
+    :return: Dict of Course objects parsed from a synthetic cart of n_courses courses
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'cart.html')
+        SyntheticCart.write_cart(path, n_courses, seed)
+        return CourseScheduleParser.shift_start_date(CourseScheduleParser.extract_courses_stream(path))
+
+
+def percentile(values, p):
+    """
+    :param p: Percentile between 0 and 100
+    :return: Value at the percentile, 0 when there are none
+    """
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+@contextlib.contextmanager
+def scratch_directory():
+    """
+    Runs the block in a new temporary working directory, removed afterwards.
+    """
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            yield directory
+        finally:
+            os.chdir(cwd)
+
+
+def run_stage(service, function, *args, **kwargs):
+    """
+    Runs one stage with the instrumentation enabled and its output silenced.
+    :return: (result of the function, dict of the measures of the stage)
+    """
+    errors = Counter(service.errors)
+    round_trips = service.round_trips
+    tracer = Instrumentation.enable()
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = function(*args, **kwargs)
+    finally:
+        seconds = time.perf_counter() - start
+        Instrumentation.disable()
+    latencies = [duration for name, _, duration, _, _ in tracer.spans if name == 'api.call']
+    return result, {
+        'seconds': round(seconds, 3),
+        'round_trips': service.round_trips - round_trips,
+        'calls': tracer.counters['api.calls'],
+        'http_errors': {str(status): n for status, n in (service.errors - errors).items()},
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'max_ms': round(max(latencies, default=0) * 1000, 2),
+    }
+
+
+def retries(executor):
+    """
+    :return: Dict with the retries and the calls given up by the executor
+    """
+    return {'retries': executor.metrics.retries, 'failures': executor.metrics.failures}
+
+
+def load_test(n_courses=50, latency=0.02, jitter=0.05, error_rate=0.02, server_error_rate=0.01, quota_per_second=100,
+              workers=8, rate=50, seed=0):
+    """
+    :param n_courses: Courses of the synthetic cart
+    :param latency: Seconds of every round trip to the fake service
+    :param jitter: Up to this many seconds added at random to each round trip
+    :param error_rate: Share of the calls failing with a 429
+    :param server_error_rate: Share of the calls failing with a 500 or 503
+    :param quota_per_second: Calls the fake service accepts per second, None for no quota
+    :param workers: Threads of the RequestExecutor
+    :param rate: Calls per second the RequestExecutor allows itself
+    :return: Dict of stage -> measures, see run_stage
+    """
+    courses = synthetic_courses(n_courses, seed)
+    blocks = sum(len(course.events) for course in courses.values())
+
+    def new_service():
+        return FakeCalendarService(latency=latency, jitter=jitter, error_rate=error_rate,
+                                   server_error_rate=server_error_rate, quota_per_second=quota_per_second, seed=seed)
+
+    def new_executor():
+        return CalendarExecutor.RequestExecutor(max_workers=workers, rate=rate, burst=rate, base_delay=0.05,
+                                                max_delay=1.0)
+
+    results = {}
+    # The deletes keep the snapshot and the journal of the calendar in the working directory, see state_path
+    with scratch_directory():
+        service = new_service()
+        outcome, measures = run_stage(service, GcalApiIntegration.populate_events, CALENDAR, courses, None, service)
+        created = len(service.calendars.get(CALENDAR, {}))
+        results['populate_events'] = measures | {'events': blocks, 'created': created, 'outcome': outcome,
+                                                 'events_per_second': round(created / measures['seconds'], 1)}
+
+        service = new_service()
+        executor = new_executor()
+        created, measures = run_stage(service, GcalApiIntegration.populate_events_batched, CALENDAR, courses, service,
+                                      executor=executor)
+        created = sum(result['error'] is None for result in created)
+        results['populate_events_batched'] = measures | retries(executor) | {
+            'events': blocks, 'created': created, 'events_per_second': round(created / measures['seconds'], 1)}
+
+        # A week in the middle of the term: series are cut and instances deleted one by one
+        first = min(event.start_date for course in courses.values() for event in course.events)
+        last = max(event.end_date for course in courses.values() for event in course.events)
+        middle = first + (last - first) / 2
+        executor = new_executor()
+        report, measures = run_stage(service, GcalApiIntegration.delete_all_events, CALENDAR, service,
+                                     start_date=middle.isoformat(), end_date=(middle + timedelta(days=7)).isoformat(),
+                                     executor=executor)
+        results['delete_all_events_week'] = measures | retries(executor) | {
+            key: len(value) if key == 'errors' else value for key, value in report.items()}
+
+        executor = new_executor()
+        report, measures = run_stage(service, GcalApiIntegration.delete_all_events, CALENDAR, service,
+                                     executor=executor)
+        results['delete_all_events'] = measures | retries(executor) | {
+            key: len(value) if key == 'errors' else value for key, value in report.items()}
+        results['delete_all_events']['left'] = len(service.calendars.get(CALENDAR, {}))
+
+    for stage, measures in results.items():
+        print(f"{stage}: {measures['seconds']:.2f} s, {measures['round_trips']} round trips, "
+              f"p50 {measures['p50_ms']} ms, p99 {measures['p99_ms']} ms, errors {measures['http_errors']}")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test publishing and deleting against a fake Calendar API.")
+    parser.add_argument('-n', '--courses', type=int, default=50,
+                        help=f"Courses of the cart, 1 to {SyntheticCart.MAX_COURSES}")
+    parser.add_argument('--latency', type=float, default=0.02, help="Seconds of every round trip")
+    parser.add_argument('--jitter', type=float, default=0.05, help="Up to this many seconds added to each round trip")
+    parser.add_argument('--error-rate', type=float, default=0.02, help="Share of the calls failing with a 429")
+    parser.add_argument('--server-error-rate', type=float, default=0.01, help="Share of the calls failing with a 5xx")
+    parser.add_argument('--quota', type=int, default=100, help="Calls per second the service accepts, 0 for no quota")
+    parser.add_argument('-j', '--workers', type=int, default=8, help="Threads of the RequestExecutor")
+    parser.add_argument('--rate', type=float, default=50, help="Calls per second the RequestExecutor allows itself")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', dest='output', default=None, help="Write the results as JSON to this file")
+    args = parser.parse_args(argv)
+    if not 1 <= args.courses <= SyntheticCart.MAX_COURSES:
+        parser.error(f"--courses must be between 1 and {SyntheticCart.MAX_COURSES}")
+
+    results = load_test(args.courses, args.latency, args.jitter, args.error_rate, args.server_error_rate,
+                        args.quota or None, args.workers, args.rate, args.seed)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
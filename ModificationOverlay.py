@@ -0,0 +1,227 @@
+import hashlib
+import json
+import os
+from datetime import date, time
+
+from CourseScheduleParser import DAY_MAPPING, TimeBlock
+from EventBuilder import keyed_blocks
+
+"""
+User overrides of the parsed courses, read from modifications.json.
+
+Every override is keyed by the TimeBlock it changes (class number, section and component, see
+EventBuilder.event_key), so it still applies when the order of the cart changes. A null value
+leaves the field as parsed. Dates and times can be overridden too, in ISO format. Ex:
+{
+    "COMP 249": {
+        "subtitle": null,
+        "events": {
+            "3103-CCCG-Tut": {"room": "H521", "start_time": "18:45", "start_date": "2023-07-05"}
+        }
+    }
+}
+The old format, with a list of events matched by position, is still read.
+Each override has its own hash, so a run can tell which of them changed since the last one.
+"""
+
+COURSE_FIELDS = ('title', 'subtitle', 'credits')
+
+
+def parse_days(value):
+    """
+    :param value: List of days, or a string. Ex: ['MO', 'WE'], 'MO,WE' or 'MoWe'
+    :return: Tuple of days. Ex: ('MO', 'WE')
+    """
+    if isinstance(value, str):
+        value = value.split(',') if ',' in value else [value[i:i + 2] for i in range(0, len(value), 2)]
+    days = tuple(day.strip().upper() for day in value)
+    for day in days:
+        if day not in DAY_MAPPING:
+            raise ValueError(f"Unknown day {day!r}")
+    return days
+
+
+FIELD_TYPES = {
+    'start_date': date.fromisoformat,
+    'end_date': date.fromisoformat,
+    'start_time': time.fromisoformat,
+    'end_time': time.fromisoformat,
+    'days': parse_days,
+}
+
+
+def typed_changes(changes, name):
+    """
+    :param changes: Dict of field -> value as written in the JSON file, nulls included
+    :param name: Name of the override, for the error messages
+    :return: Dict of field -> value of the non null fields, with dates, times and days converted
+    """
+    typed = {}
+    for field, value in changes.items():
+        if value is None:
+            continue
+        if field not in TimeBlock.__slots__:
+            raise ValueError(f"Override {name}: unknown field {field!r}")
+        try:
+            typed[field] = FIELD_TYPES.get(field, str)(value)
+        except (TypeError, ValueError) as err:
+            raise ValueError(f"Override {name}: invalid {field} {value!r}. Error: {err}") from None
+    return typed
+
+
+def entry_hash(entry):
+    return hashlib.sha1(json.dumps(entry, sort_keys=True).encode()).hexdigest()
+
+
+class Overlay:
+    """
+    Overrides of one student, by course title and by block key.
+    """
+
+    def __init__(self, courses=None, events=None):
+        """
+        :param courses: Dict of course title -> dict of course field -> value
+        :param events: Dict of (course title, block key) -> dict of TimeBlock field -> value
+        """
+        self.courses = courses or {}
+        self.events = events or {}
+        # Legacy entries, matched once the courses are known: (course title, position, changes)
+        self.positional = []
+
+    @classmethod
+    def load(cls, path='modifications.json'):
+        """
+        :return: Overlay of the file, an empty one when the file does not exist
+        """
+        overlay = cls()
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return overlay
+        for title, value in data.items():
+            course_changes = {field: value[field] for field in COURSE_FIELDS if value.get(field) is not None}
+            if course_changes:
+                overlay.courses[title] = course_changes
+            events = value.get('events') or {}
+            if isinstance(events, list):
+                for i, changes in enumerate(events):
+                    if any(value is not None for value in changes.values()):
+                        overlay.positional.append((title, i, changes))
+            else:
+                for key, changes in events.items():
+                    if any(value is not None for value in changes.values()):
+                        overlay.events[title, key] = changes
+        return overlay
+
+    def hashes(self):
+        """
+        :return: Dict of override name -> hash of its content. Ex: {'COMP 249/3103-CCCG-Tut': '1f0e...'}
+        """
+        hashes = {f"{title}": entry_hash(changes) for title, changes in self.courses.items()}
+        hashes.update({f"{title}/{key}": entry_hash(changes) for (title, key), changes in self.events.items()})
+        hashes.update({f"{title}/#{i}": entry_hash(changes) for title, i, changes in self.positional})
+        return hashes
+
+    def changed(self, previous):
+        """
+        :param previous: Result of hashes() on the last run
+        :return: Set of the names of the overrides added, changed or removed since
+        """
+        current = self.hashes()
+        return {name for name in current.keys() | previous.keys() if current.get(name) != previous.get(name)}
+
+    def resolve(self, courses):
+        """
+        Matches the legacy entries to block keys. A legacy entry applies to the block at its position,
+        unless its section and component point to another block of the course.
+        """
+        keys = {}
+        for key, course, event in keyed_blocks(courses):
+            keys.setdefault(course.title, []).append((key, event))
+        for title, i, changes in self.positional:
+            blocks = keys.get(title, [])
+            matches = [key for key, event in blocks
+                       if (event.section, event.component) == (changes.get('section'), changes.get('component'))]
+            if i < len(blocks) and (blocks[i][0] in matches or not matches):
+                key = blocks[i][0]
+            elif matches:
+                key = matches[0]
+            else:
+                continue
+            # The section and component of a legacy entry identify the block, they are not overrides
+            changes = {field: value for field, value in changes.items()
+                       if value is not None and field not in ('section', 'component')}
+            if changes:
+                self.events[title, key] = changes
+        self.positional = []
+
+    def apply(self, courses):
+        """
+        :param courses: Dict of Course objects, left unchanged
+        :return: (dict of Course objects with the overrides applied, list of the overrides that matched nothing)
+        """
+        self.resolve(courses)
+        unmatched = {title for title in self.courses if title not in courses}
+        unmatched.update(f"{title}/{key}" for title, key in self.events)
+
+        result = {}
+        for key, course, event in keyed_blocks(courses):
+            if (changes := self.events.get((course.title, key))) is not None:
+                unmatched.discard(f"{course.title}/{key}")
+                event = event.replace(**typed_changes(changes, f"{course.title}/{key}"))
+            result.setdefault(course.title, []).append(event)
+
+        applied = {}
+        for title, course in courses.items():
+            changes = self.courses.get(title, {})
+            applied[title] = course.replace(changes.get('title'), changes.get('subtitle'), changes.get('credits'),
+                                            result.get(title, ()))
+        return applied, sorted(unmatched)
+
+
+def template(courses):
+    """
+    :param courses: Dict of Course objects, left unchanged
+    :return: Dict of the content of a modifications.json to fill in, every value is null
+    """
+    data = {}
+    for key, course, event in keyed_blocks(courses):
+        entry = data.setdefault(course.title, dict.fromkeys(COURSE_FIELDS) | {'events': {}})
+        entry['events'][key] = dict.fromkeys(TimeBlock.__slots__)
+    return data
+
+
+def write_template(courses, path='modifications.json'):
+    with open(path, 'w') as f:
+        json.dump(template(courses), f, indent=4)
+
+
+def apply_file(courses, path='modifications.json', state_path='modifications_hash.json'):
+    """
+    Applies the overrides of the file, creating an empty one when there is none.
+    :param state_path: File keeping the hashes of the overrides of the last run, None to not keep them
+    :return: (dict of Course objects, set of the names of the overrides changed since the last run)
+    """
+    if not os.path.exists(path):
+        write_template(courses, path)
+        print(f"Created {path}, fill in the values to change, null keeps the parsed value")
+        return courses, set()
+
+    overlay = Overlay.load(path)
+    courses, unmatched = overlay.apply(courses)
+    for name in unmatched:
+        print(f"The override {name} of {path} matches no class of the cart")
+    if state_path is None:
+        return courses, set(overlay.hashes())
+
+    try:
+        with open(state_path, 'r') as f:
+            previous = json.load(f)
+    except (FileNotFoundError, ValueError):
+        previous = {}
+    changed = overlay.changed(previous)
+    if changed:
+        with open(state_path, 'w') as f:
+            json.dump(overlay.hashes(), f, indent=4)
+    return courses, changed
@@ -0,0 +1,130 @@
+import numpy as np
+
+from CourseScheduleParser import DAY_MAPPING
+
+"""
+Expands TimeBlocks into the concrete class meetings they produce.
+
+Every (TimeBlock, weekday) pair becomes a weekly arithmetic sequence of dates, so a whole
+batch of blocks is expanded with a handful of NumPy operations instead of a loop per meeting.
+"""
+
+# 1970-01-01, day 0 of datetime64[D], was a Thursday
+EPOCH_WEEKDAY = 3
+
+
+class Occurrences:
+    """
+    Class meetings as parallel arrays, one entry per meeting.
+    block: index of the TimeBlock in the expanded list, start/end: datetime64[m], local time.
+    """
+
+    def __init__(self, block, start, end):
+        self.block = block
+        self.start = start
+        self.end = end
+
+    def __len__(self):
+        return len(self.block)
+
+    def sorted(self):
+        """
+        :return: Occurrences ordered by start time
+        """
+        order = np.argsort(self.start, kind='stable')
+        return Occurrences(self.block[order], self.start[order], self.end[order])
+
+    def between(self, start, end):
+        """
+        :param start: datetime.date or datetime.datetime, included
+        :param end: datetime.date or datetime.datetime, excluded
+        :return: Occurrences starting in [start, end)
+        """
+        mask = (self.start >= np.datetime64(start, 'm')) & (self.start < np.datetime64(end, 'm'))
+        return Occurrences(self.block[mask], self.start[mask], self.end[mask])
+
+    def dates_by_block(self, n_blocks):
+        """
+        :param n_blocks: Number of TimeBlocks that were expanded
+        :return: List of n_blocks sorted datetime64[D] arrays, the meeting dates of each TimeBlock
+        """
+        order = np.lexsort((self.start, self.block))
+        dates = self.start[order].astype('datetime64[D]')
+        bounds = np.searchsorted(self.block[order], np.arange(n_blocks + 1))
+        return [dates[bounds[i]:bounds[i + 1]] for i in range(n_blocks)]
+
+    def of_block(self, i):
+        """
+        :return: Occurrences of the TimeBlock number i
+        """
+        mask = self.block == i
+        return Occurrences(self.block[mask], self.start[mask], self.end[mask])
+
+
+def expand(blocks, exclusions=None):
+    """
+    Expands TimeBlocks into their class meetings, from start_date to end_date included,
+    on every day of days, minus the excluded dates.
+    :param blocks: List of TimeBlock objects
+    :param exclusions: Iterable of datetime.date to skip, ex: a ParseAcademicCalendar.ClosureIndex
+    :return: Occurrences
+    """
+    pair_block, pair_weekday, pair_start, pair_end, pair_from, pair_to = [], [], [], [], [], []
+    for i, block in enumerate(blocks):
+        if block.start_date is None or block.start_time is None or not block.days:
+            continue
+        start_minutes = block.start_time.hour * 60 + block.start_time.minute
+        end_minutes = block.end_time.hour * 60 + block.end_time.minute
+        for day in block.days:
+            pair_block.append(i)
+            pair_weekday.append(DAY_MAPPING[day])
+            pair_start.append(start_minutes)
+            pair_end.append(end_minutes)
+            pair_from.append(block.start_date)
+            pair_to.append(block.end_date)
+
+    if not pair_block:
+        empty = np.array([], dtype='datetime64[m]')
+        return Occurrences(np.array([], dtype=np.int64), empty, empty.copy())
+
+    pair_block = np.array(pair_block, dtype=np.int64)
+    date_from = np.array(pair_from, dtype='datetime64[D]')
+    date_to = np.array(pair_to, dtype='datetime64[D]')
+
+    # First date on or after start_date falling on the weekday, then one meeting every 7 days
+    weekday_from = (date_from.astype(np.int64) + EPOCH_WEEKDAY) % 7
+    first = date_from + (np.array(pair_weekday) - weekday_from) % 7
+    counts = np.maximum((date_to - first).astype(np.int64) // 7 + 1, 0)
+
+    pair = np.repeat(np.arange(len(pair_block)), counts)
+    week = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    dates = first[pair] + week * 7
+
+    if exclusions is not None:
+        excluded = np.array(list(exclusions), dtype='datetime64[D]')
+        if len(excluded):
+            keep = ~np.isin(dates, excluded)
+            pair, dates = pair[keep], dates[keep]
+
+    minutes = dates.astype('datetime64[m]')
+    start = minutes + np.array(pair_start, dtype='timedelta64[m]')[pair]
+    end = minutes + np.array(pair_end, dtype='timedelta64[m]')[pair]
+    return Occurrences(pair_block[pair], start, end)
+
+
+def weekdays(dates):
+    """
+    :param dates: datetime64[D] array
+    :return: Array of the day of the week of each date, 0 for Monday
+    """
+    return (dates.astype(np.int64) + EPOCH_WEEKDAY) % 7
+
+
+def expand_courses(courses, exclusions=None):
+    """
+    Expands every TimeBlock of the courses.
+    :param courses: Dict of Course objects
+    :return: (list of (Course, TimeBlock) indexed by Occurrences.block, Occurrences)
+    """
+    pairs = [(course, event) for course in courses.values() for event in course.events]
+    return pairs, expand([event for _, event in pairs], exclusions)
@@ -1,21 +1,141 @@
-from bs4 import BeautifulSoup
-import requests
+import bisect
+import calendar
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+
 import datetime
 
+import AcademicCalendarCache
+
+UNDERGRADUATE_URL = "https://www.concordia.ca/students/undergraduate/undergraduate-academic-dates.html"
+GRADUATE_URL = "https://www.concordia.ca/students/graduate/graduate-academic-dates.html"
+# Pages merged by closure_index, both list the dates of the current academic year
+CALENDAR_URLS = [UNDERGRADUATE_URL, GRADUATE_URL]
+
+# "Mon, Oct. 9 2017", "Monday, October 9, 2017", "Oct 9 2017"
+DATE_PATTERN = re.compile(r'^\s*(?:[A-Za-z]+\.?,?\s+)?([A-Za-z]+)\.?\s+(\d{1,2}),?\s+(\d{4})\s*$')
+MONTH_NAMES = ('january', 'february', 'march', 'april', 'may', 'june', 'july', 'august', 'september', 'october',
+               'november', 'december')
+# Full and abbreviated month names -> month number
+MONTHS = {**{name: i for i, name in enumerate(MONTH_NAMES, 1)},
+          **{name[:3]: i for i, name in enumerate(MONTH_NAMES, 1)},
+          'sept': 9}
+
+logger = logging.getLogger(__name__)
+
 
 def get_calendar_page(url):
-    page = requests.get(url)
+    page = AcademicCalendarCache.get_session().get(url, timeout=AcademicCalendarCache.TIMEOUT)
+    page.raise_for_status()
+    from bs4 import BeautifulSoup
     return BeautifulSoup(page.content, 'html.parser')
 
 
-def scrape_academic_calendar():
-    url = "https://www.concordia.ca/students/undergraduate/undergraduate-academic-dates.html"
+class ClosureIndex:
+    """
+    Sorted index of the days the university is closed, for range lookups.
+    """
+
+    def __init__(self, dates):
+        """
+        :param dates: datetime.date or datetime.datetime objects, in any order
+        """
+        self.dates = sorted({date.date() if isinstance(date, datetime.datetime) else date for date in dates})
+
+    def between(self, start, end):
+        """
+        :param start: datetime.date, included
+        :param end: datetime.date, included
+        :return: List of the closed days from start to end
+        """
+        return self.dates[bisect.bisect_left(self.dates, start):bisect.bisect_right(self.dates, end)]
+
+    def __contains__(self, date):
+        i = bisect.bisect_left(self.dates, date)
+        return i < len(self.dates) and self.dates[i] == date
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __iter__(self):
+        return iter(self.dates)
+
+
+def closure_index(urls=None, cache=None, fixtures=None, workers=4):
+    """
+    Merges the closed days of many academic calendar pages (undergraduate and graduate) into one index.
+    The pages are fetched and parsed concurrently. A page that fails to load is logged and left out,
+    the error is only raised when no page loads.
+    :param urls: Pages to merge, CALENDAR_URLS when None
+    :param cache: AcademicCalendarCache.AcademicCalendarCache, see scrape_academic_calendar
+    :param fixtures: Paths of saved copies of the pages, read instead of urls
+    :param workers: Number of pages fetched at the same time
+    :return: ClosureIndex of the closed days
+    """
+    if fixtures is not None:
+        jobs = [{'fixture': fixture} for fixture in fixtures]
+    else:
+        jobs = [{'url': url, 'cache': cache} for url in (urls or CALENDAR_URLS)]
+
+    def scrape(job):
+        try:
+            return scrape_academic_calendar(**job), None
+        except Exception as err:
+            logger.error("Failed to read the closed days of %s. Error: %s",
+                         job.get('url') or job.get('fixture'), err)
+            return None, err
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(scrape, jobs))
+    pages = [dates for dates, error in results if error is None]
+    if not pages and results:
+        raise results[0][1]
+    return ClosureIndex(date for dates in pages for date in dates)
+
+
+def load_closures(offline=False, fixtures=None):
+    """
+    The closure dates as the command lines load them: from the on-disk cache, revalidated with the site.
+    :param offline: Never download, only read the cached pages, see AcademicCalendarCache
+    :param fixtures: Paths of saved copies of the pages, read instead of the site and the cache
+    :return: ClosureIndex of the closed days
+    """
+    if fixtures:
+        return closure_index(fixtures=fixtures)
+    return closure_index(cache=AcademicCalendarCache.AcademicCalendarCache(offline=offline))
+
+
+def scrape_academic_calendar(url=UNDERGRADUATE_URL, cache=None, fixture=None):
+    """
+    :param url: Page of the academic calendar
+    :param cache: AcademicCalendarCache.AcademicCalendarCache. The page is only downloaded when the
+    cached copy is too old and has changed, and the dates are only parsed again when it has.
+    :param fixture: Path of a saved copy of the page, read instead of downloading anything
+    :return: List of datetime.datetime, the days the university is closed
+    """
+    if fixture is not None:
+        with open(fixture, 'rb') as f:
+            return parse_closure_dates(f.read())
+    if cache is not None:
+        return cache.get_dates(url, parse_closure_dates)
+
     soup = get_calendar_page(url)
 
     dates = list(extract_dates(soup))
     dates = list(clean_dates(dates))
     return dates
 
+
+def parse_closure_dates(html):
+    """
+    :param html: Content of an academic calendar page
+    :return: List of datetime.datetime, the days the university is closed
+    """
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, 'html.parser')
+    return list(clean_dates(extract_dates(soup)))
+
 def extract_dates(soup):
     for section in soup.findAll('div', class_="c-list-featured-events section"):
         for date in section.findAll('li'):
@@ -33,20 +153,26 @@ def clean_dates(dates):
     :return: datetime.datetime object
     """
     for date in dates:
-        if "." in date:
-            date = date.replace(".", "")
-        try:
-            date_return = datetime.datetime.strptime(date, "%a, %b %d %Y")
-        except ValueError:
-            try:
-                date_return = datetime.datetime.strptime(date, "%a, %B %d %Y")
-            except ValueError:
-                print(f"Failed to parse date, {date}")
-            else:
-                yield date_return
+        if (date_return := parse_date(date)) is None:
+            print(f"Failed to parse date, {date}")
         else:
             yield date_return
 
 
+def parse_date(text):
+    """
+    Parses a date with an abbreviated or full month name in one regex match, without exceptions.
+    :param text: Ex: "Mon, Oct. 9 2017", "Monday, October 9 2017"
+    :return: datetime.datetime, None if the text is not a valid date
+    """
+    if not (match := DATE_PATTERN.match(text)):
+        return None
+    month = MONTHS.get(match.group(1).lower())
+    day, year = int(match.group(2)), int(match.group(3))
+    if month is None or not 1 <= day <= calendar.monthrange(year, month)[1]:
+        return None
+    return datetime.datetime(year, month, day)
+
+
 if __name__ == '__main__':
     scrape_academic_calendar()
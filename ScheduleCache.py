@@ -0,0 +1,113 @@
+import hashlib
+import marshal
+import os
+import sys
+import threading
+
+import CourseScheduleParser
+import Instrumentation
+
+"""
+On-disk cache of parsed course carts.
+
+Entries are keyed by the hash of the cart file, the parser version and the marshal format of
+the interpreter, so an unchanged cart is never parsed twice and a parser change or a Python
+upgrade invalidates every entry. The cache is
+bounded in size and evicts the least recently used entries first.
+"""
+
+DEFAULT_MAX_BYTES = 64 * 2 ** 20
+
+
+class ScheduleCache:
+    """
+    Directory of small binary files, one per parsed cart, see CourseScheduleParser.courses_to_bytes.
+    """
+
+    def __init__(self, directory='.schedule_cache', max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # marshal data is only readable by the Python version that wrote it
+        self.prefix = (f"v{CourseScheduleParser.PARSER_VERSION}-m{marshal.version}-"
+                       f"py{sys.version_info[0]}.{sys.version_info[1]}-")
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, filename):
+        """
+        :return: Hash of the content of the file
+        """
+        with open(filename, 'rb') as f:
+            return hashlib.file_digest(f, 'sha256').hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{self.prefix}{key}.bin")
+
+    def get(self, key):
+        """
+        :return: Dict of course title -> Course, None on a miss
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            courses = CourseScheduleParser.courses_from_bytes(data)
+        except (FileNotFoundError, ValueError, EOFError, TypeError):
+            return None
+        # The modification time is the last use, for the LRU eviction
+        os.utime(path)
+        return courses
+
+    def put(self, key, courses):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(CourseScheduleParser.courses_to_bytes(courses))
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def get_or_parse(self, filename, extract):
+        """
+        :param filename: Cart file
+        :param extract: Function parsing the file into a dict of courses, called on a miss
+        :return: Dict of course title -> Course
+        """
+        key = self.key(filename)
+        if (courses := self.get(key)) is not None:
+            Instrumentation.count('schedule_cache.hit')
+            return courses
+        Instrumentation.count('schedule_cache.miss')
+        courses = extract(filename)
+        self.put(key, courses)
+        return courses
+
+    def evict(self):
+        """
+        Removes the entries of other parser or Python versions, then the least recently used entries
+        until the cache fits in max_bytes.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if not name.startswith(self.prefix):
+                    os.remove(path)
+                    continue
+                stat = os.stat(path)
+            except FileNotFoundError:
+                # Another process evicted it first
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
@@ -0,0 +1,299 @@
+import argparse
+import json
+import logging
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import CourseScheduleParser
+import ScheduleCache
+
+"""
+Command line entry point that never prompts, for cron jobs and worker pools.
+
+    python ScheduleCli.py parse cart.html -o courses.json
+    python ScheduleCli.py export cart.html -o schedule.ics --closures
+    python ScheduleCli.py --offline export cart.html --closures
+    python ScheduleCli.py sync cart.html --calendar ID --modifications modifications.json
+    python ScheduleCli.py delete --calendar ID --from 2023-10-08 --until 2023-12-01
+    python ScheduleCli.py delete --calendar ID --all
+    python ScheduleCli.py watch cart.html --calendar ID --modifications modifications.json
+    python ScheduleCli.py run jobs.json -j 8
+
+Every command is a job, a dict of its options. The run command reads a manifest of jobs (a JSON
+list, or one JSON object per line) and runs them concurrently in this process: the credentials,
+the Calendar service, the rate limited executor, the closure dates and the schedule cache are
+created once and shared by all the jobs. One JSON line is printed per job with its result.
+"""
+
+COMMANDS = ('parse', 'export', 'sync', 'delete', 'watch')
+
+
+class Session:
+    """
+    What the jobs of one run share, each created on first use.
+    """
+
+    def __init__(self, cache_directory=None, offline=False, closures_fixtures=None):
+        """
+        :param cache_directory: Directory of the parsed schedule cache, no cache when None
+        :param offline: Never download the academic calendar, only read its cached pages
+        :param closures_fixtures: Saved academic calendar pages to read the closure dates from
+        """
+        self.lock = threading.Lock()
+        self.offline = offline
+        self.closures_fixtures = closures_fixtures
+        self.cache = ScheduleCache.ScheduleCache(cache_directory) if cache_directory else None
+        self._closures = None
+        self._executor = None
+        self._calendar_locks = {}
+
+    def closures(self):
+        """
+        :return: ParseAcademicCalendar.ClosureIndex, loaded once per run
+        """
+        with self.lock:
+            if self._closures is None:
+                import ParseAcademicCalendar
+                self._closures = ParseAcademicCalendar.load_closures(self.offline, self.closures_fixtures)
+            return self._closures
+
+    def google(self, calendarId):
+        """
+        :return: (Calendar service, CalendarExecutor.RequestExecutor shared by every job)
+        """
+        with self.lock:
+            import CalendarExecutor
+            import GcalApiIntegration
+            service = GcalApiIntegration.get_service(calendarId)
+            if self._executor is None:
+                creds = GcalApiIntegration.create_creds(calendarId)
+                self._executor = CalendarExecutor.RequestExecutor(
+                    http_factory=lambda: GcalApiIntegration.authorized_http(creds))
+            return service, self._executor
+
+    def parse(self, cart):
+        """
+        :return: Dict of Course objects of the cart, as parsed
+        """
+        if self.cache is not None:
+            return self.cache.get_or_parse(cart, CourseScheduleParser.extract_courses_stream)
+        return CourseScheduleParser.extract_courses_stream(cart)
+
+    def calendar_lock(self, calendarId):
+        """
+        :return: Lock held by the jobs writing to the calendar. They share its snapshot and journal
+        files (see GcalApiIntegration.state_path), so they run one at a time.
+        """
+        with self.lock:
+            return self._calendar_locks.setdefault(calendarId, threading.Lock())
+
+    def courses(self, job, courses=None):
+        """
+        Parses the cart of the job and applies its modifications, if any.
+        :param courses: The cart already parsed, see parse
+        :return: Dict of Course objects
+        """
+        cart = job['cart']
+        if courses is None:
+            courses = self.parse(cart)
+        if job.get('modifications'):
+            import ModificationOverlay
+            courses, unmatched = ModificationOverlay.Overlay.load(job['modifications']).apply(courses)
+            for name in unmatched:
+                logging.warning("The override %s of %s matches no class of %s", name, job['modifications'], cart)
+        return CourseScheduleParser.shift_start_date(courses)
+
+
+def run_job(job, session):
+    """
+    :param job: Dict with the command and its options. Ex: {'command': 'sync', 'cart': 'a.html', 'calendar': '...'}
+    :param session: Session of the run
+    :return: Dict of the result of the command
+    """
+    command = job.get('command')
+    if command == 'parse':
+        courses = session.courses(job)
+        if job.get('output'):
+            with open(job['output'], 'w') as f:
+                json.dump(courses, f, cls=CourseScheduleParser.ClassEncoder)
+        return {'courses': len(courses), 'events': sum(len(course.events) for course in courses.values())}
+
+    if command == 'export':
+        import IcsExport
+        courses = session.courses(job)
+        closures = session.closures() if job.get('closures') else None
+        output = job.get('output') or f"{job['cart'].rsplit('.', 1)[0]}.ics"
+        return {'events': IcsExport.export_courses(courses, output, job.get('name'), closures), 'output': output}
+
+    import GcalApiIntegration
+    calendarId = job.get('calendar') or GcalApiIntegration.CALENDAR_ID
+    if command == 'sync':
+        courses = session.courses(job)
+        closures = session.closures() if job.get('closures') else None
+        service, executor = session.google(calendarId)
+        with session.calendar_lock(calendarId):
+            return GcalApiIntegration.publish(calendarId, courses, service, executor=executor, closures=closures)
+
+    if command == 'delete':
+        if job.get('on') and job.get('until'):
+            raise ValueError("on is a single day, it cannot be combined with until")
+        filtered = any(job.get(key) for key in ('on', 'from', 'until'))
+        if filtered == bool(job.get('all')):
+            # Ex: a manifest job with "form" instead of "from" would otherwise wipe the calendar
+            raise ValueError("A delete needs on, from or until, or all to delete every event of this tool, "
+                             "not both")
+        service, executor = session.google(calendarId)
+        with session.calendar_lock(calendarId):
+            return GcalApiIntegration.delete_all_events(calendarId, service, start_date=job.get('from'),
+                                                        specific_date=job.get('on'), end_date=job.get('until'),
+                                                        executor=executor)
+
+    if command == 'watch':
+        import CartWatcher
+        closures = session.closures() if job.get('closures') else None
+        service, executor = session.google(calendarId)
+        paths = [job['cart']] + ([job['modifications']] if job.get('modifications') else [])
+        parsed = None
+
+        def load(changed):
+            nonlocal parsed
+            # Only the overrides changed: the cart is not parsed again
+            if parsed is None or job['cart'] in changed:
+                parsed = session.parse(job['cart'])
+            return session.courses(job, parsed)
+
+        def publish(courses, keys):
+            with session.calendar_lock(calendarId):
+                return GcalApiIntegration.publish(calendarId, courses, service, executor=executor,
+                                                  closures=closures, keys=keys)
+
+        CartWatcher.watch(paths, load, publish, job.get('interval', CartWatcher.DEFAULT_INTERVAL),
+                          job.get('debounce', CartWatcher.DEFAULT_DEBOUNCE))
+        return {}
+
+    raise ValueError(f"Unknown command {command!r}, expected one of {', '.join(COMMANDS)}")
+
+
+def run_jobs(jobs, session, workers=4):
+    """
+    Runs the jobs concurrently. A failed job does not stop the others.
+    :return: Generator of (job, result, error) in the order of jobs
+    """
+
+    def run(job):
+        try:
+            return job, run_job(job, session), None
+        except Exception as err:
+            return job, None, f"{type(err).__name__}: {err}"
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(run, jobs)
+
+
+def read_manifest(path):
+    """
+    :param path: JSON file holding a list of jobs, or JSON Lines with one job per line
+    :return: List of jobs
+    """
+    with open(path, 'r') as f:
+        text = f.read()
+    if text.lstrip().startswith('['):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Parse, export and publish course carts without any prompt.")
+    parser.add_argument('--cache', default=None, help="Directory of the parsed schedule cache, no cache by default")
+    parser.add_argument('--offline', action='store_true',
+                        help="Never download the academic calendar for closures, only use its cached pages")
+    parser.add_argument('--closures-fixture', action='append', default=None, metavar='HTML',
+                        help="Saved academic calendar page to read the closed days from. Can be given many times")
+    parser.add_argument('-v', '--verbose', action='store_true')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def cart_options(command):
+        command.add_argument('cart', help="Course cart html file")
+        command.add_argument('--modifications', default=None, help="Overrides to apply, see ModificationOverlay")
+
+    parse = commands.add_parser('parse', help="Parse a cart to JSON")
+    cart_options(parse)
+    parse.add_argument('-o', '--output', default=None, help="JSON file of the courses")
+
+    export = commands.add_parser('export', help="Write a cart to an .ics file")
+    cart_options(export)
+    export.add_argument('-o', '--output', default=None, help="Output .ics file, next to the cart by default")
+    export.add_argument('--name', default=None, help="Name of the calendar in the file")
+    export.add_argument('--closures', action='store_true', help="Exclude the days the university is closed")
+
+    sync = commands.add_parser('sync', help="Make a Google calendar match a cart")
+    cart_options(sync)
+    sync.add_argument('--calendar', default=None, help="Calendar id, the default calendar otherwise")
+    sync.add_argument('--closures', action='store_true', help="Exclude the days the university is closed")
+
+    delete = commands.add_parser('delete', help="Delete the events of this tool from a Google calendar")
+    delete.add_argument('--calendar', default=None, help="Calendar id, the default calendar otherwise")
+    window = delete.add_mutually_exclusive_group()
+    window.add_argument('--on', default=None, help="Only this day, YYYY-MM-DD")
+    window.add_argument('--from', dest='from_date', default=None, help="From this day on, YYYY-MM-DD")
+    window.add_argument('--all', action='store_true', default=None, help="Every event created by this tool")
+    delete.add_argument('--until', default=None, help="Before this day, YYYY-MM-DD. Not with --on")
+
+    watch = commands.add_parser('watch', help="Keep a Google calendar in sync with a cart and its modifications "
+                                              "until interrupted, see CartWatcher")
+    cart_options(watch)
+    watch.add_argument('--calendar', default=None, help="Calendar id, the default calendar otherwise")
+    watch.add_argument('--closures', action='store_true', help="Exclude the days the university is closed")
+    watch.add_argument('--interval', type=float, default=None, help="Seconds between two checks of the files")
+    watch.add_argument('--debounce', type=float, default=None,
+                       help="Seconds the files must stay unchanged before a sync")
+
+    run = commands.add_parser('run', help="Run the jobs of a manifest concurrently")
+    run.add_argument('manifest', help="JSON list of jobs, or one JSON job per line. "
+                                      "Ex: {\"command\": \"sync\", \"cart\": \"a.html\", \"calendar\": \"...\"}")
+    run.add_argument('-j', '--workers', type=int, default=4, help="Number of jobs run at once")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == 'delete':
+        if args.until and (args.on or args.all):
+            parser.error(f"argument --until: not allowed with argument {'--on' if args.on else '--all'}")
+        if not (args.on or args.from_date or args.until or args.all):
+            parser.error("give --on, --from or --until, or --all to delete every event of this tool")
+    # The watch command reports each sync
+    level = logging.DEBUG if args.verbose else logging.INFO if args.command == 'watch' else logging.WARNING
+    logging.basicConfig(level=level, format='%(message)s')
+    session = Session(args.cache, args.offline, args.closures_fixture)
+
+    if args.command == 'run':
+        jobs = read_manifest(args.manifest)
+        workers = args.workers
+    else:
+        options = {key: value for key, value in vars(args).items()
+                   if value is not None and key not in ('cache', 'offline', 'closures_fixture', 'verbose')}
+        if 'from_date' in options:
+            options['from'] = options.pop('from_date')
+        if args.command == 'watch':
+            # Runs in the main thread, until Ctrl+C
+            try:
+                run_job(options, session)
+            except KeyboardInterrupt:
+                pass
+            return 0
+        jobs = [options]
+        workers = 1
+
+    failed = 0
+    for job, result, error in run_jobs(jobs, session, workers):
+        record = {'job': job, 'result': result} if error is None else {'job': job, 'error': error}
+        failed += error is not None
+        print(json.dumps(record, default=str))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
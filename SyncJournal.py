@@ -0,0 +1,153 @@
+import json
+import os
+
+"""
+Append-only journal of the events written to a calendar.
+
+Every created or updated TimeBlock is appended as one JSON line with its key, its event id
+and its content hash, and the file is fsynced after every batch. A push that fails halfway
+can be run again and only sends what is not in the journal yet. The journal is also a local
+index from TimeBlock key to event id.
+"""
+
+# The journal is compacted when it is opened with this many entries that were replaced or deleted since
+COMPACT_AFTER = 1000
+
+
+class SyncJournal:
+    """
+    Journal of one calendar, stored as JSON lines.
+    """
+
+    def __init__(self, calendarId, path='sync_journal.jsonl', compact_after=COMPACT_AFTER):
+        """
+        :param compact_after: Compact the journal on open when it holds this many stale entries, see compact
+        """
+        self.calendarId = calendarId
+        self.path = path
+        self.index = {}
+        self.keys_by_event = {}
+        self.pending = 0
+        # Entries of this calendar in the file
+        self.entries = 0
+        self.load()
+        self.file = open(self.path, 'a')
+        if self.entries - len(self.index) >= compact_after:
+            self.compact()
+
+    def load(self):
+        """
+        Replays the journal into the index. A line cut by a crash is ignored.
+        """
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get('calendarId') != self.calendarId:
+                    continue
+                self.entries += 1
+                if entry['op'] == 'write':
+                    self._set(entry['key'], entry['event_id'], entry['hash'])
+                else:
+                    self._unset(entry['key'])
+
+    def _set(self, key, event_id, content_hash):
+        self._unset(key)
+        self.index[key] = (event_id, content_hash)
+        self.keys_by_event[event_id] = key
+
+    def _unset(self, key):
+        if (entry := self.index.pop(key, None)) is not None:
+            self.keys_by_event.pop(entry[0], None)
+        return entry
+
+    def _append(self, entry):
+        self.file.write(json.dumps(dict(entry, calendarId=self.calendarId)) + '\n')
+        self.pending += 1
+        self.entries += 1
+
+    def record(self, key, event_id, content_hash):
+        """
+        Records that the TimeBlock key is stored in the calendar as event_id.
+        """
+        self._set(key, event_id, content_hash)
+        self._append({'op': 'write', 'key': key, 'event_id': event_id, 'hash': content_hash})
+
+    def forget(self, key):
+        """
+        Records that the event of the TimeBlock key was deleted.
+        """
+        if self._unset(key) is not None:
+            self._append({'op': 'delete', 'key': key})
+
+    def forget_event(self, event_id):
+        """
+        Same as forget, from the event id.
+        """
+        if (key := self.keys_by_event.get(event_id)) is not None:
+            self.forget(key)
+
+    def flush(self):
+        """
+        Makes the entries written since the last flush durable.
+        """
+        if self.pending:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.pending = 0
+
+    def event_id(self, key):
+        """
+        :return: Event id of the TimeBlock key, None if it was never written
+        """
+        entry = self.index.get(key)
+        return entry[0] if entry else None
+
+    def content_hash(self, key):
+        """
+        :return: Content hash of the TimeBlock key when it was written, None if it was never written
+        """
+        entry = self.index.get(key)
+        return entry[1] if entry else None
+
+    def compact(self):
+        """
+        Rewrites the journal with only the current entry of every key.
+        Entries of other calendars are kept as they are.
+        """
+        self.flush()
+        self.file.close()
+        others = []
+        with open(self.path, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get('calendarId') != self.calendarId:
+                    others.append(line)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.writelines(others)
+            for key, (event_id, content_hash) in self.index.items():
+                f.write(json.dumps({'op': 'write', 'key': key, 'event_id': event_id, 'hash': content_hash,
+                                    'calendarId': self.calendarId}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self.entries = len(self.index)
+        self.file = open(self.path, 'a')
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
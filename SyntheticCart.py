@@ -0,0 +1,120 @@
+import argparse
+import random
+import sys
+
+"""
+Writes course cart pages shaped like the PeopleSoft "list view" export, for benchmarks.
+The ids, classes and nesting are those CourseScheduleParser reads: the ACE_STDNT_ENRL_SSV2$0
+table, one CLASS_MTG_VW$scroll$i table per course and the MTG_*$n spans of every meeting row.
+Run with: python SyntheticCart.py cart.html -n 1000
+"""
+
+COMPONENTS = ['Lecture', 'Tutorial', 'Laboratory']
+DAYS = ['Mo', 'Tu', 'We', 'Th', 'Fr']
+ROOMS = ['H 521 SGW', 'H 937 SGW', 'MB S2.330 SGW', 'FB S150 SGW', 'LS 2.102 SGW', 'EV 3.309 SGW', 'TBA']
+INSTRUCTORS = ['JOUMANA DARGHAM', 'ALAN SMITH', 'MARIE TREMBLAY', 'To be Announced']
+SUBJECTS = ['COMP', 'SOEN', 'ENGR', 'COEN', 'ELEC', 'MECH', 'MATH', 'PHYS', 'CHEM', 'BIOL',
+            'ECON', 'PSYC', 'HIST', 'PHIL', 'ENGL', 'FRAN', 'ACCO', 'FINA', 'MARK', 'ARTH']
+# Start and end dates of the terms, as printed in the cart
+TERMS = {
+    'fall': '05/09/2023 - 04/12/2023',
+    'winter': '08/01/2024 - 12/04/2024',
+    'summer': '01/05/2023 - 10/08/2023',
+}
+MAX_COURSES = 10000
+CREDITS = ['3.00', '3.00', '3.50', '4.00', '1.00']
+HOURS = [(8, 45, 10, 0), (10, 15, 11, 30), (13, 15, 14, 30), (16, 15, 17, 30), (18, 30, 20, 10)]
+
+
+def time_string(hour, minute):
+    suffix = 'AM' if hour < 12 else 'PM'
+    return f"{(hour - 1) % 12 + 1}:{minute:02d}{suffix}"
+
+
+def meeting_row(n, rng, component, dates=TERMS['fall']):
+    start_hour, start_minute, end_hour, end_minute = rng.choice(HOURS)
+    days = ''.join(sorted(rng.sample(DAYS, rng.choice([1, 2])), key=DAYS.index))
+    return (
+        '<tr>'
+        f'<td><span class="PSEDITBOX_DISPONLY" id="DERIVED_CLS_DTL_CLASS_NBR${n}">{1000 + n}</span></td>'
+        f'<td><a class="PSHYPERLINK" id="MTG_SECTION${n}" href="#">{component[0]}{n % 100:02d}</a></td>'
+        f'<td><span class="PSEDITBOX_DISPONLY" id="MTG_COMP${n}">{component}</span></td>'
+        f'<td><span class="PSEDITBOX_DISPONLY" id="MTG_SCHED${n}">{days} '
+        f'{time_string(start_hour, start_minute)} - {time_string(end_hour, end_minute)}</span></td>'
+        f'<td><span class="PSEDITBOX_DISPONLY" id="MTG_LOC${n}">{rng.choice(ROOMS)}</span></td>'
+        f'<td><span class="PSEDITBOX_DISPONLY" id="DERIVED_CLS_DTL_SSR_INSTR_LONG${n}">'
+        f'{rng.choice(INSTRUCTORS)}</span></td>'
+        f'<td><span class="PSEDITBOX_DISPONLY" id="MTG_DATES${n}">{dates}</span></td>'
+        '</tr>'
+    )
+
+
+def course_title(i):
+    """
+    :return: Title of the course number i, unique up to MAX_COURSES. Ex: COMP 200
+    """
+    return f"{SUBJECTS[i % len(SUBJECTS)]} {200 + i // len(SUBJECTS)}"
+
+
+def course_block(i, n, rng, dates=TERMS['fall']):
+    """
+    :return: (html of the course row, number of meeting rows written)
+    """
+    components = COMPONENTS[:rng.choice([1, 2, 3])]
+    rows = ''.join(meeting_row(n + j, rng, component, dates) for j, component in enumerate(components))
+    html = (
+        '<tr><td>'
+        f'<div class="ui-collapsible"><h3 class="ui-bar">{course_title(i)} - SAMPLE COURSE {i}</h3>'
+        f'<span class="PSEDITBOX_DISPONLY" id="DERIVED_REGFRM1_UNT_TAKEN${i}">{rng.choice(CREDITS)}</span>'
+        f'<table id="CLASS_MTG_VW$scroll${i}"><tbody><tr><td>'
+        '<table class="ui-table"><thead><tr><th>Class</th><th>Section</th><th>Component</th>'
+        '<th>Days &amp; Times</th><th>Room</th><th>Instructor</th><th>Start/End Date</th></tr></thead>'
+        f'<tbody>{rows}</tbody></table>'
+        '</td></tr></tbody></table></div>'
+        '</td></tr>'
+    )
+    return html, len(components)
+
+
+def write_cart(path, n_courses, seed=0, term='fall'):
+    """
+    Writes a cart of n_courses courses to path, one course at a time.
+    :param n_courses: From 1 to MAX_COURSES
+    :param term: Key of TERMS, the dates of the classes
+    :return: Number of meeting rows (TimeBlocks) written
+    """
+    if not 1 <= n_courses <= MAX_COURSES:
+        raise ValueError(f"n_courses must be between 1 and {MAX_COURSES}, not {n_courses}")
+    rng = random.Random(seed)
+    n = 0
+    with open(path, 'w') as f:
+        f.write('<!DOCTYPE html><html><head><title>My Class Schedule</title></head><body>')
+        # The export carries a lot of navigation around the enrollment table
+        f.write('<div class="nav">' + '<a href="#">Link</a>' * 200 + '</div>')
+        f.write('<table id="ACE_STDNT_ENRL_SSV2$0"><tbody>')
+        for i in range(n_courses):
+            html, rows = course_block(i, n, rng, TERMS[term])
+            f.write(html)
+            n += rows
+        f.write('</tbody></table>')
+        f.write('<div class="footer">' + '<span>Footer</span>' * 200 + '</div>')
+        f.write('</body></html>')
+    return n
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic course cart.")
+    parser.add_argument('output', help="Path of the html file")
+    parser.add_argument('-n', '--courses', type=int, default=5, help=f"Number of courses, 1 to {MAX_COURSES}")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--term', choices=sorted(TERMS), default='fall')
+    args = parser.parse_args(argv)
+    if not 1 <= args.courses <= MAX_COURSES:
+        parser.error(f"--courses must be between 1 and {MAX_COURSES}")
+    rows = write_cart(args.output, args.courses, args.seed, args.term)
+    print(f"Wrote {args.courses} courses, {rows} classes, to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,46 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the root of the repository
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import CourseScheduleParser  # noqa: E402
+import SyntheticCart  # noqa: E402
+from FakeCalendarService import FakeCalendarService  # noqa: E402
+
+CALENDAR = 'test-calendar'
+
+
+@pytest.fixture
+def cart(tmp_path):
+    """
+    Path of a synthetic cart of 4 courses
+    """
+    path = str(tmp_path / 'cart.html')
+    SyntheticCart.write_cart(path, 4, seed=1)
+    return path
+
+
+@pytest.fixture
+def courses(cart):
+    """
+    Dict of Course objects of the synthetic cart
+    """
+    return CourseScheduleParser.shift_start_date(CourseScheduleParser.extract_courses_stream(cart))
+
+
+@pytest.fixture
+def service():
+    return FakeCalendarService()
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """
+    Runs the test in a temporary directory, the snapshot and the journal are written to the working directory
+    """
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
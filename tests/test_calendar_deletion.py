@@ -0,0 +1,96 @@
+import datetime
+
+import CalendarDeletion
+import GcalApiIntegration
+import SyncJournal
+from conftest import CALENDAR
+
+
+def term(courses):
+    """
+    :return: (first day, last day) of the classes
+    """
+    events = [event for course in courses.values() for event in course.events]
+    return min(event.start_date for event in events), max(event.end_date for event in events)
+
+
+def recurrences(service):
+    return {event_id: list(event['recurrence']) for event_id, event in service.calendars[CALENDAR].items()}
+
+
+def journal(calendarId=CALENDAR):
+    return SyncJournal.SyncJournal(calendarId, GcalApiIntegration.state_path('sync_journal.jsonl', calendarId))
+
+
+def test_delete_from_then_sync(courses, service, workdir):
+    first, last = term(courses)
+    GcalApiIntegration.publish(CALENDAR, courses, service)
+    published = recurrences(service)
+
+    middle = first + (last - first) / 2
+    report = GcalApiIntegration.delete_all_events(CALENDAR, service, start_date=middle.isoformat())
+    assert report['truncated_series'] == len(published) and not report['errors']
+    assert recurrences(service) != published
+
+    report = GcalApiIntegration.publish(CALENDAR, courses, service)
+    assert (report['patched'], report['unchanged']) == (len(published), 0)
+    assert recurrences(service) == published
+    assert GcalApiIntegration.publish(CALENDAR, courses, service)['unchanged'] == len(published)
+
+
+def test_delete_week_then_sync(courses, service, workdir):
+    first, last = term(courses)
+    middle = first + (last - first) / 2
+    GcalApiIntegration.publish(CALENDAR, courses, service)
+    published = recurrences(service)
+
+    report = GcalApiIntegration.delete_all_events(CALENDAR, service, start_date=middle.isoformat(),
+                                                  end_date=(middle + datetime.timedelta(days=7)).isoformat())
+    assert report['deleted_instances'] > 0 and not report['errors']
+    # The deleted instances are EXDATEs in the fake service
+    assert recurrences(service) != published
+
+    GcalApiIntegration.publish(CALENDAR, courses, service)
+    assert recurrences(service) == published
+
+
+def test_delete_on_day(courses, service, workdir):
+    GcalApiIntegration.publish(CALENDAR, courses, service)
+    published = len(service.calendars[CALENDAR])
+    event = next(iter(service.calendars[CALENDAR].values()))
+    day = datetime.date.fromisoformat(event['start']['dateTime'][:10]) + datetime.timedelta(days=7)
+
+    GcalApiIntegration.delete_all_events(CALENDAR, service, specific_date=day.isoformat())
+
+    start, end = CalendarDeletion.to_local_datetime(day), CalendarDeletion.to_local_datetime(
+        day + datetime.timedelta(days=1))
+    assert not CalendarDeletion.list_tool_series(CALENDAR, service, start, end)
+    assert len(service.calendars[CALENDAR]) == published
+
+
+def test_delete_all_forgets_the_journal(courses, service, workdir):
+    GcalApiIntegration.publish(CALENDAR, courses, service)
+    with journal() as before:
+        assert len(before.index) == len(service.calendars[CALENDAR])
+
+    report = GcalApiIntegration.delete_all_events(CALENDAR, service)
+
+    assert report['deleted_series'] == len(before.index) and not report['errors']
+    assert not service.calendars[CALENDAR]
+    with journal() as after:
+        assert not after.index
+        results = GcalApiIntegration.populate_events_batched(CALENDAR, courses, service, journal=after)
+    assert len(results) == len(before.index)
+    assert len(service.calendars[CALENDAR]) == len(before.index)
+
+
+def test_delete_all_reads_the_snapshot(courses, service, workdir):
+    GcalApiIntegration.publish(CALENDAR, courses, service)
+    GcalApiIntegration.publish(CALENDAR, courses, service)
+    published, calls = len(service.calendars[CALENDAR]), service.calls
+
+    GcalApiIntegration.delete_all_events(CALENDAR, service)
+
+    # One listing of the changes since the last publish, then the deletes
+    assert service.calls - calls == 1 + published
+    assert not service.calendars[CALENDAR]
@@ -0,0 +1,77 @@
+import socket
+import time
+
+import httplib2
+
+import CalendarExecutor
+from FakeCalendarService import http_error
+
+
+class Flaky:
+    """
+    Request failing with the given errors before it succeeds.
+    """
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.attempts = 0
+
+    def execute(self, http=None):
+        self.attempts += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'ok'
+
+
+def executor():
+    return CalendarExecutor.RequestExecutor(rate=1000, burst=1000, base_delay=0.001, max_delay=0.01)
+
+
+def test_transient_errors():
+    assert CalendarExecutor.is_transient(http_error(503, 'backendError'))
+    assert CalendarExecutor.is_transient(http_error(403, 'rateLimitExceeded'))
+    assert CalendarExecutor.is_transient(ConnectionResetError())
+    assert CalendarExecutor.is_transient(socket.timeout())
+    assert CalendarExecutor.is_transient(httplib2.HttpLib2Error())
+    assert not CalendarExecutor.is_transient(http_error(403, 'forbidden'))
+    assert not CalendarExecutor.is_transient(http_error(404, 'notFound'))
+    assert not CalendarExecutor.is_transient(ValueError())
+
+
+def test_retries_network_errors():
+    request = Flaky(ConnectionResetError(), socket.timeout(), http_error(429, 'rateLimitExceeded'))
+    assert executor().execute(request) == 'ok'
+    assert request.attempts == 4
+
+
+def test_failed_batch_keeps_the_others(service):
+    new_batch = service.new_batch_http_request
+    batches = []
+
+    def broken(http=None):
+        raise ValueError('broken')
+
+    def failing_second_batch(callback=None):
+        batch = new_batch(callback)
+        batches.append(batch)
+        if len(batches) == 2:
+            batch.execute = broken
+        return batch
+
+    service.new_batch_http_request = failing_second_batch
+    requests = [service.events().insert(calendarId='c', body={'summary': str(i)}) for i in range(120)]
+    executor = CalendarExecutor.RequestExecutor(max_workers=1, rate=1000, burst=1000)
+
+    results = executor.run_batched(service, requests, 50)
+
+    assert [error is None for _, error in results] == [True] * 50 + [False] * 50 + [True] * 20
+    assert len(service.calendars['c']) == 70
+
+
+def test_token_bucket_charges_large_batches():
+    bucket = CalendarExecutor.TokenBucket(rate=200, capacity=10)
+    start = time.monotonic()
+    for _ in range(3):
+        bucket.acquire(50)
+    # 10 tokens of burst, the other 140 at 200 per second
+    assert time.monotonic() - start >= 140 / 200 * 0.95
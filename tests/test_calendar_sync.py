@@ -0,0 +1,94 @@
+import copy
+
+import CalendarSync
+import GcalApiIntegration
+from conftest import CALENDAR
+
+
+def series(service):
+    """
+    :return: Dict of event id -> recurrence of the events of the test calendar
+    """
+    return {event_id: list(event.get('recurrence', [])) for event_id, event in service.calendars[CALENDAR].items()}
+
+
+def edit_occurrence(service, master):
+    """
+    Adds the exception Google creates when one occurrence of a series is edited in Google Calendar.
+    """
+    exception = copy.deepcopy(master)
+    exception.pop('recurrence')
+    exception.update(id=f"{master['id']}_20231009T223000Z", recurringEventId=master['id'], summary='Moved')
+    service.calendars[CALENDAR][exception['id']] = exception
+    service._record_change(CALENDAR, exception['id'], exception)
+    return exception
+
+
+def test_diff_events(courses):
+    desired = CalendarSync.desired_events(courses)
+    keys = list(desired)
+    unchanged = dict(copy.deepcopy(desired[keys[0]]), id='a')
+    changed = copy.deepcopy(desired[keys[1]])
+    changed['extendedProperties']['private']['hash'] = 'old'
+    changed['id'] = 'b'
+    duplicate = dict(copy.deepcopy(desired[keys[0]]), id='c')
+    removed = {'id': 'd', 'extendedProperties': {'private': {'key': 'gone'}}}
+
+    inserts, patches, deletes, n_unchanged = CalendarSync.diff_events(desired, [unchanged, changed, duplicate, removed])
+
+    assert n_unchanged == 1
+    assert patches == [('b', desired[keys[1]])]
+    assert deletes == ['c', 'd']
+    assert inserts == [desired[key] for key in keys[2:]]
+
+
+def test_diff_events_skips_exceptions(courses):
+    desired = CalendarSync.desired_events(courses)
+    key = next(iter(desired))
+    master = dict(copy.deepcopy(desired[key]), id='a')
+    exception = dict(copy.deepcopy(desired[key]), id='a_20231009T223000Z', recurringEventId='a')
+
+    inserts, patches, deletes, unchanged = CalendarSync.diff_events(desired, [exception, master])
+
+    assert (patches, deletes, unchanged) == ([], [], 1)
+    assert len(inserts) == len(desired) - 1
+
+
+def test_sync_events(courses, service):
+    report = CalendarSync.sync_events(CALENDAR, courses, service)
+    assert report == {'inserted': len(CalendarSync.desired_events(courses)), 'patched': 0, 'deleted': 0,
+                      'unchanged': 0, 'errors': []}
+    assert CalendarSync.sync_events(CALENDAR, courses, service)['unchanged'] == report['inserted']
+
+    title, course = next(iter(courses.items()))
+    moved = dict(courses, **{title: course.replace(events=[event.replace(room='H 999')
+                                                           for event in course.events])})
+    del moved[list(courses)[-1]]
+    report = CalendarSync.sync_events(CALENDAR, moved, service)
+    assert report['patched'] == len(course.events)
+    assert report['deleted'] == len(courses[list(courses)[-1]].events)
+    assert report['inserted'] == 0 and not report['errors']
+    assert len(service.calendars[CALENDAR]) == len(CalendarSync.desired_events(moved))
+
+
+def test_sync_events_keys(courses, service):
+    CalendarSync.sync_events(CALENDAR, courses, service)
+    title, course = next(iter(courses.items()))
+    moved = dict(courses, **{title: course.replace(events=[event.replace(room='H 999')
+                                                           for event in course.events])})
+    keys = {key for key in CalendarSync.desired_events(courses) if key.startswith(course.events[0].class_number)}
+
+    report = CalendarSync.sync_events(CALENDAR, moved, service, keys=keys)
+
+    assert (report['patched'], report['unchanged'], report['deleted']) == (len(keys), 0, 0)
+
+
+def test_publish_keeps_edited_occurrences(courses, service, workdir):
+    GcalApiIntegration.publish(CALENDAR, courses, service)
+    before = series(service)
+    exception = edit_occurrence(service, next(iter(service.calendars[CALENDAR].values())))
+
+    report = GcalApiIntegration.publish(CALENDAR, courses, service)
+
+    assert report == {'inserted': 0, 'patched': 0, 'deleted': 0, 'unchanged': len(before), 'errors': []}
+    assert series(service) == dict(before, **{exception['id']: []})
@@ -0,0 +1,32 @@
+import pytest
+
+import CourseScheduleParser
+import SyntheticCart
+
+
+@pytest.mark.parametrize('n_courses, term', [(1, 'fall'), (12, 'fall'), (40, 'winter')])
+def test_stream_matches_soup(tmp_path, n_courses, term):
+    path = str(tmp_path / 'cart.html')
+    SyntheticCart.write_cart(path, n_courses, seed=n_courses, term=term)
+
+    stream = CourseScheduleParser.extract_courses_stream(path)
+    soup = CourseScheduleParser.extract_courses_soup(path)
+
+    assert len(stream) == n_courses
+    assert list(stream) == list(soup)
+    assert stream == soup
+
+
+def test_parse_course_cart_engines(cart):
+    stream = CourseScheduleParser.parse_course_cart(cart, engine='stream')
+    soup = CourseScheduleParser.parse_course_cart(cart, engine='soup')
+    assert stream == soup
+    for course in stream.values():
+        for event in course.events:
+            # shift_start_date moved the first class to one of its days
+            assert event.start_date.weekday() in {CourseScheduleParser.DAY_MAPPING[day] for day in event.days}
+
+
+def test_cache_round_trip(courses):
+    data = CourseScheduleParser.courses_to_bytes(courses)
+    assert CourseScheduleParser.courses_from_bytes(data) == courses
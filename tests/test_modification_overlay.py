@@ -0,0 +1,83 @@
+import datetime
+import json
+
+import pytest
+
+import CartWatcher
+import ModificationOverlay
+from EventBuilder import keyed_blocks
+
+
+def first_block(courses):
+    key, course, event = keyed_blocks(courses)[0]
+    return key, course.title, event
+
+
+def test_apply_by_key(courses):
+    key, title, event = first_block(courses)
+    overlay = ModificationOverlay.Overlay(
+        courses={title: {'subtitle': 'Renamed'}},
+        events={(title, key): {'room': 'H 999', 'start_time': '07:15', 'days': 'MoWe', 'end_date': None}})
+
+    applied, unmatched = overlay.apply(courses)
+
+    assert unmatched == []
+    changed = applied[title].events[0]
+    assert (changed.room, changed.start_time, changed.days) == ('H 999', datetime.time(7, 15), ('MO', 'WE'))
+    assert changed.end_date == event.end_date
+    assert applied[title].subtitle == 'Renamed'
+    # The other courses and the input are left as they were
+    assert all(applied[other] == course for other, course in courses.items() if other != title)
+    assert courses[title].events[0] == event
+
+
+def test_unmatched_and_invalid(courses):
+    key, title, _ = first_block(courses)
+    overlay = ModificationOverlay.Overlay(courses={'NOPE 101': {'credits': '3'}},
+                                          events={(title, 'no-such-block'): {'room': 'H 1'}})
+    assert overlay.apply(courses)[1] == sorted(['NOPE 101', f'{title}/no-such-block'])
+
+    with pytest.raises(ValueError):
+        ModificationOverlay.Overlay(events={(title, key): {'colour': 'red'}}).apply(courses)
+    with pytest.raises(ValueError):
+        ModificationOverlay.Overlay(events={(title, key): {'days': 'XX'}}).apply(courses)
+
+
+def test_legacy_positions(courses, tmp_path):
+    key, title, event = first_block(courses)
+    path = tmp_path / 'modifications.json'
+    path.write_text(json.dumps({title: {'events': [
+        {'room': 'H 1', 'section': event.section, 'component': event.component}]}}))
+
+    applied, unmatched = ModificationOverlay.Overlay.load(str(path)).apply(courses)
+
+    assert unmatched == []
+    assert applied[title].events[0] == event.replace(room='H 1')
+
+
+def test_apply_file(courses, tmp_path):
+    path, state = str(tmp_path / 'modifications.json'), str(tmp_path / 'modifications_hash.json')
+    assert ModificationOverlay.apply_file(courses, path, state) == (courses, set())
+    template = json.loads(open(path).read())
+    key, title, _ = first_block(courses)
+    assert set(template[title]['events'][key]) == set(ModificationOverlay.TimeBlock.__slots__)
+
+    template[title]['events'][key]['room'] = 'H 2'
+    with open(path, 'w') as f:
+        json.dump(template, f)
+    applied, changed = ModificationOverlay.apply_file(courses, path, state)
+    assert changed == {f'{title}/{key}'}
+    assert applied[title].events[0].room == 'H 2'
+    # Nothing changed since the last run
+    assert ModificationOverlay.apply_file(courses, path, state)[1] == set()
+
+
+def test_renamed_course_keys(courses):
+    key, title, _ = first_block(courses)
+    applied, _ = ModificationOverlay.Overlay(courses={title: {'title': 'RENAMED 100'}}).apply(courses)
+    assert applied[title].title == 'RENAMED 100'
+
+    changed = CartWatcher.changed_courses(courses, applied)
+    assert changed == {title}
+    assert key in CartWatcher.course_keys(applied, changed)
+    assert CartWatcher.course_keys(applied, changed) == CartWatcher.course_keys(courses, changed)
@@ -0,0 +1,56 @@
+import json
+
+import SyncJournal
+
+
+def test_replay(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    with SyncJournal.SyncJournal('a', path) as journal:
+        journal.record('k1', 'e1', 'h1')
+        journal.record('k2', 'e2', 'h2')
+        journal.record('k1', 'e3', 'h3')
+        journal.forget_event('e2')
+    with SyncJournal.SyncJournal('b', path) as other:
+        other.record('k1', 'x1', 'y1')
+
+    journal = SyncJournal.SyncJournal('a', path)
+    journal.close()
+    assert journal.index == {'k1': ('e3', 'h3')}
+    assert (journal.event_id('k1'), journal.content_hash('k1'), journal.event_id('k2')) == ('e3', 'h3', None)
+
+
+def test_cut_line_is_ignored(tmp_path):
+    path = tmp_path / 'journal.jsonl'
+    with SyncJournal.SyncJournal('a', str(path)) as journal:
+        journal.record('k1', 'e1', 'h1')
+    with open(path, 'a') as f:
+        f.write('{"op": "write", "key": "k2", "ev')
+
+    with SyncJournal.SyncJournal('a', str(path)) as journal:
+        assert journal.index == {'k1': ('e1', 'h1')}
+
+
+def test_compact_keeps_other_calendars(tmp_path):
+    path = tmp_path / 'journal.jsonl'
+    with SyncJournal.SyncJournal('b', str(path)) as other:
+        other.record('k', 'x', 'y')
+    with SyncJournal.SyncJournal('a', str(path)) as journal:
+        for i in range(5):
+            journal.record('k', f'e{i}', 'h')
+        journal.compact()
+        journal.record('k2', 'e9', 'h')
+
+    entries = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [(entry['calendarId'], entry['event_id']) for entry in entries] == [('b', 'x'), ('a', 'e4'), ('a', 'e9')]
+
+
+def test_compacted_on_open(tmp_path):
+    path = tmp_path / 'journal.jsonl'
+    with SyncJournal.SyncJournal('a', str(path)) as journal:
+        for i in range(20):
+            journal.record('k', f'e{i}', 'h')
+    assert len(path.read_text().splitlines()) == 20
+
+    with SyncJournal.SyncJournal('a', str(path), compact_after=10) as journal:
+        assert journal.event_id('k') == 'e19'
+    assert len(path.read_text().splitlines()) == 1